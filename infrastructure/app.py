@@ -5,6 +5,7 @@ AWS CDK App - Punto de entrada para la infraestructura
 import os
 from aws_cdk import App, Environment
 from stacks.rag_stack import RagStack
+from config.stack_config import StackConfig
 
 
 app = App()
@@ -20,6 +21,7 @@ RagStack(
     app,
     "RagSystemStack",
     env=env,
+    config=StackConfig(app.node.try_get_context("env") or "dev"),
     description="Sistema RAG completo con Amazon Bedrock y OpenSearch"
 )
 
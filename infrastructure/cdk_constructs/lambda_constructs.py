@@ -3,6 +3,8 @@ Constructs reutilizables para el sistema RAG
 """
 from aws_cdk import (
     Duration,
+    RemovalPolicy,
+    Stack,
     aws_lambda as lambda_,
     aws_iam as iam,
     aws_logs as logs,
@@ -16,11 +18,15 @@ class BedrockEnabledFunction(lambda_.Function):
     Construct reutilizable para funciones que usan Bedrock
     """
     
+    # Id del rol compartido por las funciones de un mismo stack
+    SHARED_ROLE_ID = "BedrockFunctionRole"
+    
     def __init__(
         self,
         scope: Construct,
         id: str,
         bedrock_models: list = None,
+        bedrock_policy: iam.IManagedPolicy = None,
         **kwargs
     ):
         """
@@ -28,6 +34,9 @@ class BedrockEnabledFunction(lambda_.Function):
             scope: Construct padre
             id: ID del construct
             bedrock_models: Lista de modelos de Bedrock a los que dar acceso
+                (se suman a los permisos del rol compartido del stack)
+            bedrock_policy: Política administrada de Bedrock ya existente;
+                si se indica se reutiliza en vez de crear un statement inline
             **kwargs: Argumentos adicionales para lambda.Function
         """
         
@@ -39,11 +48,63 @@ class BedrockEnabledFunction(lambda_.Function):
                 "anthropic.claude-3-5-sonnet-20240620-v1:0"
             ]
         
-        # Crear rol si no se proporciona
+        # Reutilizar el rol del stack si no se proporciona uno
         if 'role' not in kwargs:
-            role = iam.Role(
+            kwargs['role'] = self._get_shared_role(
+                scope, bedrock_models, bedrock_policy
+            )
+        
+        # Configuraciones por defecto
+        if 'architecture' not in kwargs:
+            kwargs['architecture'] = lambda_.Architecture.ARM_64
+        
+        if 'timeout' not in kwargs:
+            kwargs['timeout'] = Duration.minutes(1)
+        
+        if 'memory_size' not in kwargs:
+            kwargs['memory_size'] = 1024
+        
+        # Log group propio con retención de 7 días (sin el custom resource
+        # LogRetention que crea el parámetro log_retention). Sin nombre fijo
+        # para no chocar con /aws/lambda/<función> de funciones ya desplegadas
+        if 'log_group' not in kwargs and 'log_retention' not in kwargs:
+            kwargs['log_group'] = logs.LogGroup(
                 scope,
-                f"{id}Role",
+                f"{id}LogGroup",
+                retention=logs.RetentionDays.ONE_WEEK,
+                removal_policy=RemovalPolicy.DESTROY
+            )
+        
+        # Llamar al constructor padre
+        super().__init__(scope, id, **kwargs)
+
+    
+    @classmethod
+    def _get_shared_role(
+        cls,
+        scope: Construct,
+        bedrock_models: list,
+        bedrock_policy: iam.IManagedPolicy = None
+    ) -> iam.Role:
+        """
+        Obtiene (o crea la primera vez) el rol compartido del stack y le
+        agrega los permisos de Bedrock de la función
+        
+        Args:
+            scope: Construct padre
+            bedrock_models: Modelos de Bedrock a los que dar acceso
+            bedrock_policy: Política administrada de Bedrock ya existente
+            
+        Returns:
+            Rol IAM común a todas las funciones del stack
+        """
+        # El rol vive en el árbol del stack: cada App/stack tiene el suyo
+        stack = Stack.of(scope)
+        role = stack.node.try_find_child(cls.SHARED_ROLE_ID)
+        if role is None:
+            role = iam.Role(
+                stack,
+                cls.SHARED_ROLE_ID,
                 assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
                 managed_policies=[
                     iam.ManagedPolicy.from_aws_managed_policy_name(
@@ -51,32 +112,27 @@ class BedrockEnabledFunction(lambda_.Function):
                     )
                 ]
             )
-            
-            # Agregar permisos de Bedrock
+        
+        # Agregar permisos de Bedrock de esta función (CDK no duplica la
+        # política administrada ni los statements idénticos)
+        if bedrock_policy is not None:
+            role.add_managed_policy(bedrock_policy)
+        else:
             role.add_to_policy(
                 iam.PolicyStatement(
                     actions=[
                         "bedrock:InvokeModel",
                         "bedrock:InvokeModelWithResponseStream"
                     ],
-                    resources=["*"]  # Bedrock requiere wildcard
+                    resources=[
+                        f"arn:{stack.partition}:bedrock:{stack.region}"
+                        f"::foundation-model/{model}"
+                        for model in bedrock_models
+                    ]
                 )
             )
-            
-            kwargs['role'] = role
-        
-        # Configuraciones por defecto
-        if 'timeout' not in kwargs:
-            kwargs['timeout'] = Duration.minutes(1)
-        
-        if 'memory_size' not in kwargs:
-            kwargs['memory_size'] = 1024
         
-        if 'log_retention' not in kwargs:
-            kwargs['log_retention'] = logs.RetentionDays.ONE_WEEK
-        
-        # Llamar al constructor padre
-        super().__init__(scope, id, **kwargs)
+        return role
 
 
 class RagLambdaLayer(lambda_.LayerVersion):
@@ -90,6 +146,8 @@ class RagLambdaLayer(lambda_.LayerVersion):
         id: str,
         asset_path: str,
         description: str = "RAG System dependencies",
+        runtimes: list = None,
+        architectures: list = None,
         **kwargs
     ):
         """
@@ -98,16 +156,22 @@ class RagLambdaLayer(lambda_.LayerVersion):
             id: ID del construct
             asset_path: Ruta al código del layer
             description: Descripción del layer
+            runtimes: Runtimes compatibles (por defecto solo Python 3.11)
+            architectures: Arquitecturas compatibles (por defecto ARM64)
         """
         
+        if runtimes is None:
+            runtimes = [lambda_.Runtime.PYTHON_3_11]
+        
+        if architectures is None:
+            architectures = [lambda_.Architecture.ARM_64]
+        
         super().__init__(
             scope,
             id,
             code=lambda_.Code.from_asset(asset_path),
-            compatible_runtimes=[
-                lambda_.Runtime.PYTHON_3_11,
-                lambda_.Runtime.PYTHON_3_10
-            ],
+            compatible_runtimes=runtimes,
+            compatible_architectures=architectures,
             description=description,
             **kwargs
         )
@@ -2,10 +2,15 @@
 Stack principal del sistema RAG
 Define toda la infraestructura necesaria
 """
+import json
+
 from aws_cdk import (
     Stack,
     Duration,
+    AssetHashType,
+    BundlingOptions,
     CfnOutput,
+    Fn,
     RemovalPolicy,
     aws_s3 as s3,
     aws_lambda as lambda_,
@@ -13,18 +18,139 @@ from aws_cdk import (
     aws_iam as iam,
     aws_rds as rds,
     aws_ec2 as ec2,
-    aws_secretsmanager as secretsmanager,
+    aws_ecr_assets as ecr_assets,
+    aws_logs as logs,
     aws_s3_notifications as s3n,
 )
 from constructs import Construct
 
+from config.stack_config import StackConfig
+
+
+# Modelos de Bedrock que pueden invocar los Lambdas (embeddings + LLMs)
+BEDROCK_MODELS = (
+    "amazon.titan-embed-text-v2:0",
+    "anthropic.claude-3-sonnet-20240229-v1:0",
+    "anthropic.claude-3-5-sonnet-20240620-v1:0",
+)
+
+# Días de log_retention_days -> RetentionDays de CloudWatch (enum de jsii)
+LOG_RETENTION_DAYS = {
+    1: logs.RetentionDays.ONE_DAY,
+    3: logs.RetentionDays.THREE_DAYS,
+    5: logs.RetentionDays.FIVE_DAYS,
+    7: logs.RetentionDays.ONE_WEEK,
+    14: logs.RetentionDays.TWO_WEEKS,
+    30: logs.RetentionDays.ONE_MONTH,
+    60: logs.RetentionDays.TWO_MONTHS,
+    90: logs.RetentionDays.THREE_MONTHS,
+    180: logs.RetentionDays.SIX_MONTHS,
+    365: logs.RetentionDays.ONE_YEAR,
+}
+
+# Archivos que no entran en el fingerprint de los assets de Lambda (menos bytes
+# que hashear en cada synth). Con bundling, exclude no filtra /asset-input: el
+# contenedor ve el directorio completo y PRECOMPILE_COMMAND borra lo mismo
+ASSET_EXCLUDE = [
+    "__pycache__",
+    "*.pyc",
+    "*.pyo",
+    "tests/*",
+    "*.dist-info/*",
+    "*.egg-info/*",
+    "*.md",
+    "*.txt",
+    "LICENSE*",
+    "NOTICE*",
+    "examples/*",
+    "docs/*"
+]
+
+# Contexto de build de la imagen de ingesta (raíz del repositorio): solo se
+# necesitan shared/ y lambda/ingestion/
+INGESTION_IMAGE_EXCLUDE = [
+    ".git",
+    "**/__pycache__",
+    "**/*.pyc",
+    "infrastructure",
+    "layers",
+    "docs",
+    "scripts",
+    "lambda/query"
+]
+
+# Los layers se construyen en Docker (ARM64) y el hash del asset se calcula
+# sobre la salida: tocar mtimes o permisos del origen no fuerza una nueva
+# subida. Se eliminan bytecode y metadatos de pip para que la salida sea
+# determinista (psycopg2 no lee su versión con importlib.metadata)
+LAYER_CLEANUP_COMMAND = (
+    " && find /asset-output -name '__pycache__' -prune -exec rm -rf {} +"
+    " && find /asset-output -name '*.dist-info' -prune -exec rm -rf {} +"
+    " && find /asset-output \\( -name '*.pyc' -o -name '*.pyo' -o -name '*.so.debug' \\) -delete"
+)
+
+
+def bundled_layer_code(path: str, command: str) -> lambda_.Code:
+    """Asset de layer construido con la imagen de bundling de Python 3.11"""
+    return lambda_.Code.from_asset(
+        path,
+        asset_hash_type=AssetHashType.OUTPUT,
+        bundling=BundlingOptions(
+            image=lambda_.Runtime.PYTHON_3_11.bundling_image,
+            platform="linux/arm64",
+            command=["bash", "-c", command + LAYER_CLEANUP_COMMAND],
+            user="root"
+        )
+    )
+
+
+# Copia el código del Lambda sin lo que no se usa en runtime (README,
+# requirements.txt, __pycache__ locales...), lo compila a bytecode (.pyc junto
+# al fuente, -b) y elimina los .py salvo handler.py, para que el runtime no
+# compile en cada cold start. handler.py se queda como fuente (lo pide el
+# handler de Lambda) y su handler.pyc no se usaría: el fuente tiene prioridad
+PRECOMPILE_COMMAND = (
+    "cp -r /asset-input/. /asset-output"
+    " && find /asset-output \\( -name '__pycache__' -o -name 'tests'"
+    " -o -name 'examples' -o -name 'docs' -o -name '*.dist-info' -o -name '*.egg-info'"
+    " \\) -prune -exec rm -rf {} +"
+    " && find /asset-output \\( -name '*.pyc' -o -name '*.pyo' -o -name '*.md'"
+    " -o -name '*.txt' -o -name 'LICENSE*' -o -name 'NOTICE*' \\) -delete"
+    " && python -m compileall -q -b /asset-output"
+    " && find /asset-output -name 'handler.pyc' -delete"
+    " && find /asset-output -name '*.py' -not -name 'handler.py' -delete"
+)
+
+
+def precompiled_lambda_code(path: str) -> lambda_.Code:
+    """Asset de Lambda empaquetado como bytecode precompilado"""
+    return lambda_.Code.from_asset(
+        path,
+        asset_hash_type=AssetHashType.SOURCE,
+        exclude=ASSET_EXCLUDE,
+        bundling=BundlingOptions(
+            image=lambda_.Runtime.PYTHON_3_11.bundling_image,
+            command=["bash", "-c", PRECOMPILE_COMMAND]
+        )
+    )
+
 
 class RagStack(Stack):
     """Stack principal del sistema RAG con AWS Bedrock y RDS PostgreSQL + pgvector"""
 
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        config: StackConfig = None,
+        **kwargs
+    ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        # Configuración por ambiente (-c env=staging|prod, por defecto dev)
+        self.config = config or StackConfig(self.node.try_get_context("env") or "dev")
+        self.removal_policy = RemovalPolicy[self.config.removal_policy]
+
         # 1. Crear S3 Buckets
         self.create_s3_buckets()
 
@@ -34,19 +160,22 @@ class RagStack(Stack):
         # 3. Crear Lambda Layer con dependencias compartidas
         self.create_lambda_layers()
 
-        # 4. Crear Lambda de Ingesta
+        # 4. Crear política de Bedrock compartida por ambos Lambdas
+        self.create_bedrock_policy()
+
+        # 5. Crear Lambda de Ingesta
         self.create_ingestion_lambda()
 
-        # 5. Crear Lambda de Query
+        # 6. Crear Lambda de Query
         self.create_query_lambda()
 
-        # 6. Crear API Gateway
+        # 7. Crear API Gateway
         self.create_api_gateway()
 
-        # 7. Configurar triggers S3
+        # 8. Configurar triggers S3
         self.configure_s3_triggers()
 
-        # 8. Outputs útiles
+        # 9. Outputs útiles
         self.create_outputs()
 
     def create_s3_buckets(self):
@@ -60,8 +189,9 @@ class RagStack(Stack):
             versioned=True,
             encryption=s3.BucketEncryption.S3_MANAGED,
             block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
-            removal_policy=RemovalPolicy.DESTROY,  # Para desarrollo
-            auto_delete_objects=True,  # Limpieza automática en destroy
+            removal_policy=self.removal_policy,
+            # Limpieza automática en destroy (solo dev: crea un custom resource)
+            auto_delete_objects=self.config.auto_delete_objects,
             lifecycle_rules=[
                 s3.LifecycleRule(
                     id="DeleteOldVersions",
@@ -77,19 +207,43 @@ class RagStack(Stack):
             bucket_name=None,
             encryption=s3.BucketEncryption.S3_MANAGED,
             block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
-            removal_policy=RemovalPolicy.DESTROY,
-            auto_delete_objects=True
+            removal_policy=self.removal_policy,
+            auto_delete_objects=self.config.auto_delete_objects
         )
 
     def create_rds_database(self):
         """Crea RDS PostgreSQL público con extensión pgvector (Free Tier)"""
         
-        # Usar VPC por defecto
-        self.vpc = ec2.Vpc.from_lookup(
-            self,
-            "DefaultVPC",
-            is_default=True
-        )
+        # Usar VPC por defecto. Si el contexto trae sus atributos se importa
+        # directamente y el synth no hace ninguna consulta a EC2
+        vpc_id = self.node.try_get_context("default_vpc_id")
+        public_subnet_ids = self.node.try_get_context("default_vpc_public_subnet_ids")
+        availability_zones = self.node.try_get_context("default_vpc_azs")
+        
+        if vpc_id and public_subnet_ids and availability_zones:
+            route_table_ids = self.node.try_get_context("default_vpc_public_route_table_ids")
+            # El endpoint gateway de S3 del RDS Proxy necesita las tablas de
+            # rutas, que una VPC importada por atributos no conoce
+            if self._context_flag("use_rds_proxy") and not route_table_ids:
+                raise ValueError(
+                    "use_rds_proxy=true con la VPC importada por atributos requiere "
+                    "default_vpc_public_route_table_ids en el contexto (o quitar "
+                    "default_vpc_id para usar Vpc.from_lookup)"
+                )
+            self.vpc = ec2.Vpc.from_vpc_attributes(
+                self,
+                "DefaultVPC",
+                vpc_id=vpc_id,
+                availability_zones=availability_zones,
+                public_subnet_ids=public_subnet_ids,
+                public_subnet_route_table_ids=route_table_ids
+            )
+        else:
+            self.vpc = ec2.Vpc.from_lookup(
+                self,
+                "DefaultVPC",
+                is_default=True
+            )
         
         # Credenciales en Secrets Manager
         self.db_credentials = rds.DatabaseSecret(
@@ -119,8 +273,8 @@ class RagStack(Stack):
             storage_type=rds.StorageType.GP2,
             backup_retention=Duration.days(0),  # Sin backups para desarrollo
             delete_automated_backups=True,
-            removal_policy=RemovalPolicy.DESTROY,
-            deletion_protection=False,
+            removal_policy=self.removal_policy,
+            deletion_protection=self.removal_policy != RemovalPolicy.DESTROY,
             publicly_accessible=True,  # RDS público
             multi_az=False  # Single AZ para Free Tier
         )
@@ -131,16 +285,167 @@ class RagStack(Stack):
             "Allow PostgreSQL from Lambda and internet"
         )
 
+        # RDS Proxy (opcional, -c use_rds_proxy=true): los Lambdas toman
+        # conexiones de un pool ya abierto y se autentican con IAM en lugar
+        # de leer el secret y negociar una conexión nueva en cada cold start
+        self.db_proxy = None
+        if self._context_flag("use_rds_proxy"):
+            self.db_proxy = self.database.add_proxy(
+                "RagDbProxy",
+                secrets=[self.db_credentials],
+                vpc=self.vpc,
+                vpc_subnets=ec2.SubnetSelection(
+                    subnet_type=ec2.SubnetType.PUBLIC
+                ),
+                require_tls=True,
+                iam_auth=True,
+                borrow_timeout=Duration.seconds(30),
+                max_connections_percent=80
+            )
+
+            # El proxy solo es accesible desde la VPC: los Lambdas se conectan
+            # a ella y llegan a Bedrock y S3 por VPC endpoints (sin NAT)
+            self.lambda_security_group = ec2.SecurityGroup(
+                self,
+                "LambdaSecurityGroup",
+                vpc=self.vpc,
+                description="Lambdas del sistema RAG"
+            )
+            self.db_proxy.connections.allow_default_port_from(
+                self.lambda_security_group,
+                "Allow PostgreSQL from Lambdas"
+            )
+            self.vpc.add_interface_endpoint(
+                "BedrockRuntimeEndpoint",
+                service=ec2.InterfaceVpcEndpointAwsService.BEDROCK_RUNTIME,
+                subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC)
+            )
+            self.vpc.add_gateway_endpoint(
+                "S3Endpoint",
+                service=ec2.GatewayVpcEndpointAwsService.S3,
+                subnets=[ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC)]
+            )
+
+    def _context_flag(self, key: str) -> bool:
+        """Lee un flag booleano del contexto (true en cdk.json o "true" con -c)"""
+        return str(self.node.try_get_context(key)).lower() == "true"
+
+    def _lambda_vpc_options(self) -> dict:
+        """Opciones de red para los Lambdas (solo en VPC si se usa RDS Proxy)"""
+        if self.db_proxy is None:
+            return {}
+        return {
+            "vpc": self.vpc,
+            "vpc_subnets": ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
+            "allow_public_subnet": True,
+            "security_groups": [self.lambda_security_group]
+        }
+
+    def _db_environment(self) -> dict:
+        """Variables de entorno de conexión a la base de datos"""
+        # Ingesta y query deben usar el mismo índice (vector o halfvec)
+        index_environment = {
+            "HALFVEC_INDEX": "true" if self._context_flag("halfvec_index") else "false"
+        }
+        if self.db_proxy is None:
+            return {
+                "DB_SECRET_ARN": self.db_credentials.secret_arn,
+                "DB_NAME": "ragdb",
+                **index_environment
+            }
+        return {
+            "DB_ENDPOINT": self.db_proxy.endpoint,
+            "DB_USER": "rag_admin",
+            "DB_NAME": "ragdb",
+            **index_environment
+        }
+
+    def _log_retention(self) -> logs.RetentionDays:
+        """Retención de los logs de Lambda según log_retention_days del ambiente"""
+        days = self.config.log_retention_days
+        if days not in LOG_RETENTION_DAYS:
+            raise ValueError(
+                f"log_retention_days={days} no es un valor de retención de CloudWatch válido"
+            )
+        return LOG_RETENTION_DAYS[days]
+
+    def _create_log_group(self, id: str) -> logs.LogGroup:
+        """
+        Log group del Lambda con la retención del ambiente (sin el custom
+        resource LogRetention). Sin log_group_name fijo: el nombre lo genera
+        CloudFormation y no choca con /aws/lambda/<función> ya existentes
+        """
+        return logs.LogGroup(
+            self,
+            id,
+            retention=self._log_retention(),
+            removal_policy=self.removal_policy
+        )
+
+    def _grant_db_access(self, function: lambda_.IFunction):
+        """Da acceso a la base de datos: lectura del secret o IAM auth al proxy"""
+        if self.db_proxy is None:
+            self.db_credentials.grant_read(function)
+        else:
+            self.db_proxy.grant_connect(function, "rag_admin")
+
     def create_lambda_layers(self):
         """Crea Lambda Layers con dependencias compartidas"""
         
-        # Layer con código compartido y dependencias
-        self.shared_layer = lambda_.LayerVersion(
-            self,
+        # Layers separados: un cambio en una dependencia solo invalida su
+        # propio layer y el resto sigue aprovechando la caché de Lambda.
+        # El Lambda de ingesta trae sus dependencias en su imagen de contenedor
+        self.shared_layer = self._create_layer(
             "SharedCodeLayer",
-            code=lambda_.Code.from_asset("../layer_build"),
+            bundled_layer_code(
+                "../shared",
+                "mkdir -p /asset-output/python/shared"
+                " && cp -r /asset-input/. /asset-output/python/shared"
+            ),
+            "Código compartido: clientes de Bedrock y PostgreSQL"
+        )
+        self.db_layer = self._create_layer(
+            "DatabaseLayer",
+            bundled_layer_code(
+                "../layers/db",
+                "pip install --no-compile --no-cache-dir"
+                " --target /asset-output/python -r requirements.txt"
+            ),
+            "Driver de PostgreSQL (psycopg2) y orjson"
+        )
+
+    def _create_layer(self, id: str, code: lambda_.Code, description: str) -> lambda_.LayerVersion:
+        """Crea un Lambda Layer ARM64 para Python 3.11"""
+        return lambda_.LayerVersion(
+            self,
+            id,
+            code=code,
             compatible_runtimes=[lambda_.Runtime.PYTHON_3_11],
-            description="Código compartido y dependencias: Bedrock, PostgreSQL, PDF processing"
+            compatible_architectures=[lambda_.Architecture.ARM_64],
+            description=description
+        )
+
+    def create_bedrock_policy(self):
+        """Crea una única política administrada con permisos de Bedrock"""
+        
+        # Limitar la política a los ARNs de los modelos usados
+        model_arns = [
+            f"arn:{self.partition}:bedrock:{self.region}::foundation-model/{model}"
+            for model in BEDROCK_MODELS
+        ]
+        
+        self.bedrock_policy = iam.ManagedPolicy(
+            self,
+            "BedrockInvokePolicy",
+            statements=[
+                iam.PolicyStatement(
+                    actions=[
+                        "bedrock:InvokeModel",
+                        "bedrock:InvokeModelWithResponseStream"
+                    ],
+                    resources=model_arns
+                )
+            ]
         )
 
     def create_ingestion_lambda(self):
@@ -158,39 +463,45 @@ class RagStack(Stack):
             ]
         )
 
-        # Permisos para Bedrock
-        ingestion_role.add_to_policy(
-            iam.PolicyStatement(
-                actions=[
-                    "bedrock:InvokeModel",
-                    "bedrock:InvokeModelWithResponseStream"
-                ],
-                resources=["*"]
+        # Permisos para Bedrock (política compartida)
+        ingestion_role.add_managed_policy(self.bedrock_policy)
+        if self.db_proxy is not None:
+            ingestion_role.add_managed_policy(
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AWSLambdaVPCAccessExecutionRole"
+                )
             )
-        )
 
-        # Función Lambda de Ingesta (sin VPC)
-        self.ingestion_lambda = lambda_.Function(
+        # Función Lambda de Ingesta (sin VPC) empaquetada como imagen de contenedor:
+        # Lambda carga bajo demanda solo los archivos de las dependencias de
+        # PDF/DOCX que se leen en el init, en vez de descargar un zip completo
+        self.ingestion_lambda = lambda_.DockerImageFunction(
             self,
             "IngestionLambda",
-            runtime=lambda_.Runtime.PYTHON_3_11,
-            handler="handler.lambda_handler",
-            code=lambda_.Code.from_asset("../lambda/ingestion"),
+            architecture=lambda_.Architecture.ARM_64,  # Graviton
+            code=lambda_.DockerImageCode.from_image_asset(
+                "..",
+                file="lambda/ingestion/Dockerfile",
+                platform=ecr_assets.Platform.LINUX_ARM64,
+                exclude=INGESTION_IMAGE_EXCLUDE
+            ),
             timeout=Duration.minutes(5),
             memory_size=2048,
             role=ingestion_role,
-            layers=[self.shared_layer],
+            log_group=self._create_log_group("IngestionLambdaLogGroup"),
+            **self._lambda_vpc_options(),
             environment={
-                "DB_SECRET_ARN": self.db_credentials.secret_arn,
-                "DB_NAME": "ragdb",
+                **self._db_environment(),
                 "BEDROCK_EMBEDDING_MODEL": "amazon.titan-embed-text-v2:0",
                 "CHUNK_SIZE": "800",
-                "CHUNK_OVERLAP": "100"
+                "CHUNK_OVERLAP": "100",
+                "CHUNK_EMBED_CONCURRENCY": "8",
+                "PYTHONDONTWRITEBYTECODE": "1"
             }
         )
 
-        # Permisos para leer secret
-        self.db_credentials.grant_read(self.ingestion_lambda)
+        # Permisos de acceso a la base de datos
+        self._grant_db_access(self.ingestion_lambda)
 
         # Permisos de S3
         self.raw_bucket.grant_read(self.ingestion_lambda)
@@ -211,41 +522,60 @@ class RagStack(Stack):
             ]
         )
 
-        # Permisos para Bedrock
-        query_role.add_to_policy(
-            iam.PolicyStatement(
-                actions=[
-                    "bedrock:InvokeModel",
-                    "bedrock:InvokeModelWithResponseStream"
-                ],
-                resources=["*"]
+        # Permisos para Bedrock (política compartida)
+        query_role.add_managed_policy(self.bedrock_policy)
+        if self.db_proxy is not None:
+            query_role.add_managed_policy(
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AWSLambdaVPCAccessExecutionRole"
+                )
             )
-        )
 
         # Función Lambda de Query (sin VPC)
         self.query_lambda = lambda_.Function(
             self,
             "QueryLambda",
             runtime=lambda_.Runtime.PYTHON_3_11,
+            architecture=lambda_.Architecture.ARM_64,  # Graviton
             handler="handler.lambda_handler",
-            code=lambda_.Code.from_asset("../lambda/query"),
+            code=precompiled_lambda_code("../lambda/query"),
             timeout=Duration.seconds(60),
             memory_size=1024,
             role=query_role,
-            layers=[self.shared_layer],
+            log_group=self._create_log_group("QueryLambdaLogGroup"),
+            **self._lambda_vpc_options(),
+            layers=[self.shared_layer, self.db_layer],
+            tracing=lambda_.Tracing.DISABLED,  # X-Ray añade latencia al init
             environment={
-                "DB_SECRET_ARN": self.db_credentials.secret_arn,
-                "DB_NAME": "ragdb",
+                **self._db_environment(),
                 "BEDROCK_EMBEDDING_MODEL": "amazon.titan-embed-text-v2:0",
                 "BEDROCK_LLM_MODEL": "anthropic.claude-3-sonnet-20240229-v1:0",
                 "TOP_K": "5",
                 "MIN_SIMILARITY": "0.1",
-                "USE_CACHE": "true"
+                "USE_CACHE": "true",
+                "PYTHONDONTWRITEBYTECODE": "1"
             }
         )
 
-        # Permisos para leer secret
-        self.db_credentials.grant_read(self.query_lambda)
+        # Permisos de acceso a la base de datos
+        self._grant_db_access(self.query_lambda)
+
+        # Provisioned concurrency (opcional, -c provisioned_concurrency=true):
+        # ambientes pre-inicializados para POST /query, sin cold start
+        self.query_target = self.query_lambda
+        if self._context_flag("provisioned_concurrency"):
+            self.query_alias = lambda_.Alias(
+                self,
+                "QueryLambdaLiveAlias",
+                alias_name="live",
+                version=self.query_lambda.current_version,
+                provisioned_concurrent_executions=2
+            )
+            self.query_alias.add_auto_scaling(
+                min_capacity=2,
+                max_capacity=20
+            ).scale_on_utilization(utilization_target=0.7)
+            self.query_target = self.query_alias
 
     def create_api_gateway(self):
         """Crea API Gateway REST para exponer endpoints"""
@@ -259,7 +589,15 @@ class RagStack(Stack):
             deploy_options=apigateway.StageOptions(
                 stage_name="prod",
                 throttling_rate_limit=100,
-                throttling_burst_limit=200
+                throttling_burst_limit=200,
+                # Throttle propio para /health: el sondeo de monitores no
+                # consume el presupuesto del resto de métodos del stage
+                method_options={
+                    "/health/GET": apigateway.MethodDeploymentOptions(
+                        throttling_rate_limit=50,
+                        throttling_burst_limit=100
+                    )
+                }
             ),
             default_cors_preflight_options=apigateway.CorsOptions(
                 allow_origins=apigateway.Cors.ALL_ORIGINS,
@@ -273,7 +611,7 @@ class RagStack(Stack):
         
         # Integración con Lambda de Query
         query_integration = apigateway.LambdaIntegration(
-            self.query_lambda,
+            self.query_target,
             proxy=True
         )
         
@@ -299,7 +637,7 @@ class RagStack(Stack):
             ingest_integration
         )
 
-        # Health check endpoint
+        # Health check endpoint (cacheable 60 s por clientes y CDNs)
         health_resource = self.api.root.add_resource("health")
         health_resource.add_method(
             "GET",
@@ -309,6 +647,9 @@ class RagStack(Stack):
                         status_code="200",
                         response_templates={
                             "application/json": '{"status": "ok", "service": "RAG System"}'
+                        },
+                        response_parameters={
+                            "method.response.header.Cache-Control": "'max-age=60'"
                         }
                     )
                 ],
@@ -317,38 +658,32 @@ class RagStack(Stack):
                 }
             ),
             method_responses=[
-                apigateway.MethodResponse(status_code="200")
+                apigateway.MethodResponse(
+                    status_code="200",
+                    response_parameters={
+                        "method.response.header.Cache-Control": True
+                    }
+                )
             ]
         )
 
     def configure_s3_triggers(self):
         """Configura triggers de S3 para Lambda de ingesta"""
         
-        # Notificación cuando se sube un archivo al bucket raw
+        # Una sola notificación para toda la carpeta documents/: el filtrado
+        # por extensión se hace en el Lambda (S3 no admite OR entre sufijos)
         self.raw_bucket.add_event_notification(
             s3.EventType.OBJECT_CREATED,
             s3n.LambdaDestination(self.ingestion_lambda),
             s3.NotificationKeyFilter(
-                prefix="documents/",  # Solo procesar archivos en esta carpeta
-                suffix=".pdf"  # Agregar más sufijos según necesidad
+                prefix="documents/"  # Solo procesar archivos en esta carpeta
             )
         )
-        
-        # Agregar más notificaciones para otros formatos
-        for suffix in [".docx", ".txt", ".md", ".html"]:
-            self.raw_bucket.add_event_notification(
-                s3.EventType.OBJECT_CREATED,
-                s3n.LambdaDestination(self.ingestion_lambda),
-                s3.NotificationKeyFilter(
-                    prefix="documents/",
-                    suffix=suffix
-                )
-            )
 
     def create_outputs(self):
         """Crea outputs útiles del stack"""
         
-        # URL de la API
+        # URL de la API (exportada para otros stacks)
         CfnOutput(
             self,
             "ApiUrl",
@@ -357,23 +692,7 @@ class RagStack(Stack):
             export_name="RagApiUrl"
         )
 
-        # Endpoint de query
-        CfnOutput(
-            self,
-            "QueryEndpoint",
-            value=f"{self.api.url}query",
-            description="Endpoint para realizar consultas"
-        )
-
-        # Endpoint de ingest
-        CfnOutput(
-            self,
-            "IngestEndpoint",
-            value=f"{self.api.url}ingest",
-            description="Endpoint para ingestar documentos"
-        )
-
-        # Nombre del bucket raw
+        # Nombre del bucket raw (exportado para otros stacks)
         CfnOutput(
             self,
             "RawBucketName",
@@ -382,34 +701,33 @@ class RagStack(Stack):
             export_name="RagRawBucketName"
         )
 
-        # Endpoint de RDS
+        # Resto de valores agrupados en un único output JSON
         CfnOutput(
             self,
-            "DatabaseEndpoint",
-            value=self.database.db_instance_endpoint_address,
-            description="Endpoint de la base de datos PostgreSQL"
-        )
-
-        # Secret ARN
-        CfnOutput(
-            self,
-            "DatabaseSecretArn",
-            value=self.db_credentials.secret_arn,
-            description="ARN del secret con credenciales de DB"
-        )
-
-        # ARN de Lambda de Ingesta
-        CfnOutput(
-            self,
-            "IngestionLambdaArn",
-            value=self.ingestion_lambda.function_arn,
-            description="ARN de Lambda de Ingesta"
-        )
-
-        # ARN de Lambda de Query
-        CfnOutput(
-            self,
-            "QueryLambdaArn",
-            value=self.query_lambda.function_arn,
-            description="ARN de Lambda de Query"
+            "RagSystem",
+            value=Fn.sub(
+                json.dumps({
+                    "apiUrl": "${ApiUrl}",
+                    "queryEndpoint": "${ApiUrl}query",
+                    "ingestEndpoint": "${ApiUrl}ingest",
+                    "rawBucket": "${Raw}",
+                    "dbEndpoint": "${Db}",
+                    "dbSecret": "${Sec}",
+                    "ingestArn": "${Ing}",
+                    "queryArn": "${Qry}",
+                    "ingestLogGroup": "${IngLogs}",
+                    "queryLogGroup": "${QryLogs}"
+                }),
+                {
+                    "ApiUrl": self.api.url,
+                    "Raw": self.raw_bucket.bucket_name,
+                    "Db": self.database.db_instance_endpoint_address,
+                    "Sec": self.db_credentials.secret_arn,
+                    "Ing": self.ingestion_lambda.function_arn,
+                    "Qry": self.query_lambda.function_arn,
+                    "IngLogs": self.ingestion_lambda.log_group.log_group_name,
+                    "QryLogs": self.query_lambda.log_group.log_group_name
+                }
+            ),
+            description="Endpoints, base de datos, ARNs y log groups del sistema RAG (JSON)"
         )
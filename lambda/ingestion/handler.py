@@ -2,16 +2,40 @@
 AWS Lambda Handler para Ingesta de Documentos
 Procesa documentos, genera embeddings y los indexa en PostgreSQL + pgvector
 """
+import base64
+import hashlib
 import json
+import logging
 import os
 import boto3
 import uuid
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, Tuple
+
+# orjson (opcional) serializa y parsea JSON bastante más rápido que json
+try:
+    import orjson
+    
+    def _dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+    
+    _loads = orjson.loads
+except ImportError:
+    _dumps = json.dumps
+    _loads = json.loads
 
 # Importar utilidades locales
-from utils.document_processor import DocumentProcessor, get_metadata_from_file
-from utils.text_chunker import chunk_text, clean_text
+from utils.document_processor import (
+    DocumentProcessor,
+    FileContent,
+    SUPPORTED_EXTENSIONS,
+    as_seekable_file,
+    get_metadata_from_file
+)
+from utils.text_chunker import TextChunk, chunk_text, clean_text
 
 # Importar clientes compartidos
 import sys
@@ -19,21 +43,59 @@ sys.path.append('/opt/python')  # Para Lambda Layers
 
 try:
     from shared.utils.bedrock_client import get_bedrock_client
-    from shared.utils.postgres_client import PostgresVectorClient
+    from shared.utils.postgres_client import get_postgres_client
 except ImportError as e:
     print(f"Warning: No se pudieron importar shared utilities: {e}")
 
 
+# Logger del módulo (nivel configurable con LOG_LEVEL, p.ej. DEBUG o WARNING)
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
 # Cliente S3
 s3_client = boto3.client('s3')
 
 # Variables de entorno
 DB_SECRET_ARN = os.environ.get('DB_SECRET_ARN')
 DB_NAME = os.environ.get('DB_NAME', 'ragdb')
+# Definidas solo cuando se despliega con RDS Proxy (autenticación IAM)
+DB_ENDPOINT = os.environ.get('DB_ENDPOINT')
+DB_USER = os.environ.get('DB_USER')
+# Índice HNSW en media precisión (embedding::halfvec); igual que en el Lambda de Query
+HALFVEC_INDEX = os.environ.get('HALFVEC_INDEX', 'false').lower() == 'true'
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
 BEDROCK_EMBEDDING_MODEL = os.environ.get('BEDROCK_EMBEDDING_MODEL', 'amazon.titan-embed-text-v2:0')
 CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', '800'))
 CHUNK_OVERLAP = int(os.environ.get('CHUNK_OVERLAP', '100'))
+# Llamadas concurrentes a Bedrock al generar embeddings (Titan: un texto por llamada)
+CHUNK_EMBED_CONCURRENCY = int(os.environ.get('CHUNK_EMBED_CONCURRENCY', '8'))
+# Chunks por INSERT en PostgreSQL mientras continúan los embeddings
+INDEX_BATCH_SIZE = int(os.environ.get('INDEX_BATCH_SIZE', '500'))
+
+# Memoria mínima recomendada cuando se paralelizan los embeddings
+MIN_MEMORY_FOR_CONCURRENCY_MB = 1024
+
+
+def validate_environment():
+    """
+    Revisa la configuración del Lambda al iniciar el contenedor
+    
+    Lambda asigna CPU y ancho de banda de red en proporción a la memoria, y la
+    ingesta está limitada por la latencia de Bedrock: el throughput de
+    embeddings crece aproximadamente con memoria × CHUNK_EMBED_CONCURRENCY.
+    Con poca memoria, subir la concurrencia no aporta porque las llamadas
+    compiten por la misma red y la misma fracción de vCPU
+    """
+    memory_mb = int(os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '0'))
+    if memory_mb and memory_mb < MIN_MEMORY_FOR_CONCURRENCY_MB and CHUNK_EMBED_CONCURRENCY > 1:
+        logger.warning(
+            "Lambda con %d MB y CHUNK_EMBED_CONCURRENCY=%d: con menos de %d MB "
+            "la concurrencia de embeddings apenas mejora el throughput",
+            memory_mb, CHUNK_EMBED_CONCURRENCY, MIN_MEMORY_FOR_CONCURRENCY_MB
+        )
+
+
+validate_environment()
 
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -48,7 +110,13 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Returns:
         Respuesta con el resultado del procesamiento
     """
-    print(f"Evento recibido: {json.dumps(event)}")
+    # El evento completo solo se serializa en DEBUG; en INFO basta un resumen
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Evento recibido: %s", _dumps(event))
+    else:
+        records = event.get('Records') or []
+        first_key = records[0].get('s3', {}).get('object', {}).get('key') if records else None
+        logger.info("Evento recibido: %d records (primer archivo: %s)", len(records), first_key)
     
     try:
         # Determinar si es un evento de S3 o API Gateway
@@ -60,12 +128,10 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return process_api_event(event, context)
             
     except Exception as e:
-        print(f"Error en lambda_handler: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error en lambda_handler: %s", e)
         return {
             'statusCode': 500,
-            'body': json.dumps({
+            'body': _dumps({
                 'error': str(e),
                 'message': 'Error procesando documento'
             })
@@ -84,16 +150,24 @@ def process_s3_event(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             bucket = record['s3']['bucket']['name']
             key = record['s3']['object']['key']
             
-            print(f"Procesando archivo: s3://{bucket}/{key}")
+            # La notificación de S3 cubre todo el prefijo: ignorar formatos no soportados
+            if os.path.splitext(key)[1].lower() not in SUPPORTED_EXTENSIONS:
+                logger.info("Archivo ignorado (formato no soportado): s3://%s/%s", bucket, key)
+                results.append({
+                    'file': key,
+                    'status': 'skipped'
+                })
+                continue
             
-            # Descargar archivo de S3
+            logger.info("Procesando archivo: s3://%s/%s", bucket, key)
+            
+            # Leer el archivo de S3 como stream (sin cargarlo entero en memoria)
             response = s3_client.get_object(Bucket=bucket, Key=key)
-            file_content = response['Body'].read()
             file_size = response['ContentLength']
             
             # Procesar documento
             result = process_document(
-                file_content=file_content,
+                file_content=response['Body'],
                 filename=key,
                 file_size=file_size,
                 source=f"s3://{bucket}/{key}"
@@ -101,13 +175,13 @@ def process_s3_event(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             results.append({
                 'file': key,
-                'status': 'success',
+                'status': 'duplicate' if result.get('duplicate') else 'success',
                 'document_id': result['document_id'],
                 'chunks_created': result.get('chunks_count', 0)
             })
             
         except Exception as e:
-            print(f"Error procesando {key}: {str(e)}")
+            logger.error("Error procesando %s: %s", key, e)
             results.append({
                 'file': key,
                 'status': 'error',
@@ -116,7 +190,7 @@ def process_s3_event(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     return {
         'statusCode': 200,
-        'body': json.dumps({
+        'body': _dumps({
             'message': 'Procesamiento completado',
             'results': results
         })
@@ -131,13 +205,13 @@ def process_api_event(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         # Parsear body si es string
         body = event.get('body', {})
         if isinstance(body, str):
-            body = json.loads(body)
+            body = _loads(body)
         
         # Validar parámetros requeridos
         if 'content' not in body:
             return {
                 'statusCode': 400,
-                'body': json.dumps({
+                'body': _dumps({
                     'error': 'Parámetro "content" requerido'
                 })
             }
@@ -147,7 +221,6 @@ def process_api_event(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         filename = body.get('filename', 'document.txt')
         
         # Si el contenido está en base64, decodificar
-        import base64
         if body.get('is_base64', False):
             file_content = base64.b64decode(content)
         else:
@@ -162,7 +235,7 @@ def process_api_event(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         return {
             'statusCode': 200,
-            'body': json.dumps({
+            'body': _dumps({
                 'message': 'Documento procesado exitosamente',
                 'document_id': result['document_id'],
                 'chunks_count': result['chunks_count']
@@ -170,17 +243,107 @@ def process_api_event(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
         
     except Exception as e:
-        print(f"Error en process_api_event: {str(e)}")
+        logger.error("Error en process_api_event: %s", e)
         return {
             'statusCode': 500,
-            'body': json.dumps({
+            'body': _dumps({
                 'error': str(e)
             })
         }
 
 
+def embed_and_index_chunks(
+    chunks: Iterable[TextChunk],
+    metadata: Dict[str, Any],
+    document_id: str,
+    pg_client: Any
+) -> Tuple[int, int]:
+    """
+    Genera embeddings con un pool de threads e indexa los chunks por lotes
+    
+    Los embeddings se piden en orden y con un límite de llamadas en vuelo;
+    cada vez que se completa un lote se inserta en PostgreSQL mientras el
+    pool sigue generando los embeddings de los chunks siguientes
+    
+    Args:
+        chunks: Chunks del documento, en orden
+        metadata: Metadatos comunes del documento
+        document_id: ID del documento padre
+        pg_client: Cliente de PostgreSQL
+        
+    Returns:
+        Tupla (chunks procesados, chunks indexados)
+    """
+    bedrock_client = get_bedrock_client(region_name=AWS_REGION)
+    
+    def embed(content: str) -> array:
+        # Cada embedding se guarda como array de float32 (4 bytes por valor en
+        # lugar de un float de Python) mientras espera en el lote
+        return array('f', bedrock_client.generate_embeddings(
+            text=content,
+            model_id=BEDROCK_EMBEDDING_MODEL
+        ))
+    
+    chunks_count = 0
+    indexed_count = 0
+    batch = []
+    in_flight = deque()
+    max_in_flight = CHUNK_EMBED_CONCURRENCY * 4
+    
+    def collect_oldest():
+        nonlocal indexed_count, batch
+        i, chunk, future = in_flight.popleft()
+        batch.append({
+            'document_id': f"{document_id}_chunk_{i}",
+            'content': chunk.content,
+            'embedding': future.result(),
+            'metadata': {
+                **metadata,
+                'chunk_index': i,
+                'parent_document_id': document_id
+            }
+        })
+        if len(batch) >= INDEX_BATCH_SIZE:
+            indexed_count += pg_client.bulk_index_documents(batch)
+            batch = []
+    
+    executor = ThreadPoolExecutor(max_workers=CHUNK_EMBED_CONCURRENCY)
+    try:
+        for i, chunk in enumerate(chunks):
+            in_flight.append((i, chunk, executor.submit(embed, chunk.content)))
+            chunks_count += 1
+            if len(in_flight) >= max_in_flight:
+                collect_oldest()
+        
+        while in_flight:
+            collect_oldest()
+    except Exception:
+        # Un embedding fallido cancela los pendientes y se propaga
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+    
+    if batch:
+        indexed_count += pg_client.bulk_index_documents(batch)
+    
+    return chunks_count, indexed_count
+
+
+def _get_pg_client():
+    """Cliente de PostgreSQL reutilizado entre invocaciones"""
+    return get_postgres_client(
+        db_secret_arn=DB_SECRET_ARN,
+        db_name=DB_NAME,
+        region=AWS_REGION,
+        host=DB_ENDPOINT,
+        username=DB_USER,
+        iam_auth=bool(DB_ENDPOINT),
+        halfvec_index=HALFVEC_INDEX
+    )
+
+
 def process_document(
-    file_content: bytes,
+    file_content: FileContent,
     filename: str,
     file_size: int,
     source: str
@@ -189,7 +352,7 @@ def process_document(
     Procesa un documento completo: extrae texto, chunking, embeddings e indexación
     
     Args:
-        file_content: Contenido del archivo en bytes
+        file_content: Contenido del archivo en bytes o como stream
         filename: Nombre del archivo
         file_size: Tamaño del archivo
         source: Origen del documento
@@ -202,66 +365,80 @@ def process_document(
     # 1. Extraer extensión del archivo
     file_extension = os.path.splitext(filename)[1]
     
-    print(f"Extrayendo texto de {filename}...")
+    logger.info("Extrayendo texto de %s...", filename)
+    
+    pg_client = _get_pg_client()
+    
+    # 2. Extraer texto del documento. El stream se vuelca una sola vez a un
+    # archivo con seek (en memoria o en /tmp), que también se usa para el hash
+    file_obj = as_seekable_file(file_content)
+    try:
+        content_sha256 = hashlib.file_digest(file_obj, 'sha256').hexdigest()
+        
+        # Si el mismo contenido ya está indexado no se vuelve a procesar
+        existing_document_id = pg_client.find_document_by_hash(content_sha256)
+        if existing_document_id:
+            logger.info(
+                "Documento duplicado (sha256=%s), ya indexado como %s",
+                content_sha256, existing_document_id
+            )
+            return {
+                'document_id': existing_document_id,
+                'filename': filename,
+                'chunks_count': 0,
+                'indexed_count': 0,
+                'duplicate': True
+            }
+        
+        file_obj.seek(0)
+        text, document_metadata = DocumentProcessor.extract_text_and_metadata(
+            file_obj, file_extension
+        )
+    finally:
+        file_obj.close()
     
-    # 2. Extraer texto del documento
-    text = DocumentProcessor.extract_text(file_content, file_extension)
     text = clean_text(text)
     
-    print(f"Texto extraído: {len(text)} caracteres")
+    logger.info("Texto extraído: %d caracteres", len(text))
     
-    # 3. Extraer metadatos
-    metadata = get_metadata_from_file(filename, file_size, file_content, file_extension)
+    # 3. Extraer metadatos (los de PDF salen de la misma lectura del texto)
+    metadata = get_metadata_from_file(filename, file_size, file_extension, document_metadata)
+    metadata['content_sha256'] = content_sha256
     metadata['source'] = source
     metadata['processed_at'] = datetime.utcnow().isoformat()
     
     # 4. Dividir en chunks
-    print(f"Dividiendo texto en chunks...")
+    logger.debug("Dividiendo texto en chunks...")
     chunks = chunk_text(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
     
-    print(f"Generado {len(chunks)} chunks")
-    
-    # 5. Generar embeddings e indexar en PostgreSQL
-    print("Generando embeddings e indexando...")
-    bedrock_client = get_bedrock_client(region_name=AWS_REGION)
-    
-    documents_to_index = []
-    for i, chunk in enumerate(chunks):
-        # Generar embedding
-        embedding = bedrock_client.generate_embeddings(
-            text=chunk.content,
-            model_id=BEDROCK_EMBEDDING_MODEL
+    # 5. Generar embeddings e indexar en PostgreSQL por lotes. Los lotes se
+    # confirman por separado: si algo falla se borran los ya insertados para
+    # que el reintento vuelva a ingestar el documento completo
+    logger.debug("Generando embeddings e indexando...")
+    try:
+        chunks_count, indexed_count = embed_and_index_chunks(
+            chunks, metadata, document_id, pg_client
         )
         
-        chunk_document_id = f"{document_id}_chunk_{i}"
-        
-        documents_to_index.append({
-            'document_id': chunk_document_id,
-            'content': chunk.content,
-            'embedding': embedding,
-            'metadata': {
-                **metadata,
-                'chunk_index': i,
-                'parent_document_id': document_id
-            }
-        })
-    
-    print(f"Embeddings generados para {len(documents_to_index)} chunks")
-    
-    # 6. Indexar en PostgreSQL
-    with PostgresVectorClient(
-        db_secret_arn=DB_SECRET_ARN,
-        db_name=DB_NAME,
-        region=AWS_REGION
-    ) as pg_client:
-        indexed_count = pg_client.bulk_index_documents(documents_to_index)
+        # 6. El hash solo se registra con el documento completo indexado
+        pg_client.mark_document_ingested(content_sha256, document_id)
+    except Exception:
+        logger.error("Ingesta fallida, eliminando los chunks ya indexados de %s", document_id)
+        try:
+            pg_client.delete_document_chunks(document_id)
+        except Exception:
+            logger.exception("No se pudieron eliminar los chunks de %s", document_id)
+        raise
     
-    print(f"Indexación completada: {indexed_count} documentos indexados")
+    logger.info(
+        "Indexación completada: %d de %d chunks indexados",
+        indexed_count, chunks_count
+    )
     
     return {
         'document_id': document_id,
         'filename': filename,
-        'chunks_count': len(documents_to_index),
+        'chunks_count': chunks_count,
         'indexed_count': indexed_count,
         'metadata': metadata
     }
@@ -275,13 +452,13 @@ def process_api_event(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         # Parsear body si es string
         body = event.get('body', {})
         if isinstance(body, str):
-            body = json.loads(body)
+            body = _loads(body)
         
         # Validar parámetros requeridos
         if 'content' not in body:
             return {
                 'statusCode': 400,
-                'body': json.dumps({
+                'body': _dumps({
                     'error': 'Parámetro "content" requerido'
                 })
             }
@@ -291,7 +468,6 @@ def process_api_event(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         filename = body.get('filename', 'document.txt')
         
         # Si el contenido está en base64, decodificar
-        import base64
         if body.get('is_base64', False):
             file_content = base64.b64decode(content)
         else:
@@ -306,7 +482,7 @@ def process_api_event(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         return {
             'statusCode': 200,
-            'body': json.dumps({
+            'body': _dumps({
                 'message': 'Documento procesado exitosamente',
                 'document_id': result['document_id'],
                 'chunks_count': result['chunks_count']
@@ -314,10 +490,10 @@ def process_api_event(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
         
     except Exception as e:
-        print(f"Error en process_api_event: {str(e)}")
+        logger.error("Error en process_api_event: %s", e)
         return {
             'statusCode': 500,
-            'body': json.dumps({
+            'body': _dumps({
                 'error': str(e)
             })
         }
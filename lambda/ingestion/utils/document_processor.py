@@ -2,20 +2,107 @@
 Procesadores de documentos para diferentes formatos
 """
 import io
-from typing import Optional, Dict, Any
+import re
+import shutil
+import tempfile
+from typing import Optional, Dict, Any, Tuple, Union, BinaryIO
 from pathlib import Path
 
+# Dependencias opcionales de cada formato: se importan una sola vez al cargar
+# el módulo (en el init del Lambda) y no en cada documento procesado
+try:
+    import pypdfium2 as pdfium
+    _HAS_PDFIUM = True
+except ImportError:
+    _HAS_PDFIUM = False
+
+try:
+    import PyPDF2
+    _HAS_PYPDF2 = True
+except ImportError:
+    _HAS_PYPDF2 = False
+
+try:
+    import pdfplumber
+    _HAS_PDFPLUMBER = True
+except ImportError:
+    _HAS_PDFPLUMBER = False
+
+try:
+    from docx import Document
+    _HAS_DOCX = True
+except ImportError:
+    _HAS_DOCX = False
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+    _HAS_SELECTOLAX = True
+except ImportError:
+    _HAS_SELECTOLAX = False
+
+try:
+    from bs4 import BeautifulSoup
+    _HAS_BS4 = True
+except ImportError:
+    _HAS_BS4 = False
+
+
+# Extensiones que el sistema sabe procesar
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt', '.md', '.html', '.htm')
+
+# Tramos de espacios en blanco que separan frases en el texto de un HTML
+_HTML_BREAK_RE = re.compile(r'\s*(?:[\r\n]| {2,})\s*')
+
+# Los archivos hasta este tamaño se mantienen en memoria; los mayores se
+# vuelcan a /tmp mientras se leen desde el stream de S3
+SPOOL_MAX_SIZE = 16 << 20
+
+# Contenido de un documento: bytes ya leídos o un objeto tipo archivo (stream de S3)
+FileContent = Union[bytes, BinaryIO]
+
+
+def as_seekable_file(file_content: FileContent) -> BinaryIO:
+    """
+    Devuelve el contenido como archivo con seek, posicionado al inicio
+    
+    Args:
+        file_content: Bytes o stream (p.ej. el StreamingBody de S3, sin seek)
+        
+    Returns:
+        Archivo con seek: BytesIO, el mismo archivo o un SpooledTemporaryFile
+    """
+    if isinstance(file_content, (bytes, bytearray)):
+        return io.BytesIO(file_content)
+    
+    seekable = getattr(file_content, 'seekable', None)
+    if seekable is not None and seekable():
+        file_content.seek(0)
+        return file_content
+    
+    # PyPDF2 y python-docx necesitan seek: copiar el stream por bloques
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    shutil.copyfileobj(file_content, spooled, 1 << 20)
+    spooled.seek(0)
+    return spooled
+
+
+def read_bytes(file_content: FileContent) -> bytes:
+    """Lee el contenido completo como bytes (formatos de texto)"""
+    if isinstance(file_content, (bytes, bytearray)):
+        return bytes(file_content)
+    return as_seekable_file(file_content).read()
+
 
 class DocumentProcessor:
     """Clase base para procesadores de documentos"""
     
     @staticmethod
-    def extract_text(file_content: bytes, file_extension: str) -> str:
+    def extract_text(file_content: FileContent, file_extension: str) -> str:
         """
         Extrae texto de un documento según su tipo
         
         Args:
-            file_content: Contenido del archivo en bytes
+            file_content: Contenido del archivo en bytes o como archivo
             file_extension: Extensión del archivo (.pdf, .docx, etc.)
             
         Returns:
@@ -33,34 +120,49 @@ class DocumentProcessor:
             return HTMLProcessor.extract_text(file_content)
         else:
             raise ValueError(f"Formato de archivo no soportado: {extension}")
+    
+    @staticmethod
+    def extract_text_and_metadata(
+        file_content: FileContent,
+        file_extension: str
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Extrae texto y metadatos propios del formato en una sola lectura
+        
+        Args:
+            file_content: Contenido del archivo en bytes o como archivo
+            file_extension: Extensión del archivo (.pdf, .docx, etc.)
+            
+        Returns:
+            Tupla (texto, metadatos); los metadatos solo existen para PDFs
+        """
+        if file_extension.lower().lstrip('.') == 'pdf':
+            return PDFProcessor.extract_text_and_metadata(file_content)
+        return DocumentProcessor.extract_text(file_content, file_extension), {}
 
 
 class PDFProcessor:
     """Procesador para archivos PDF"""
     
     @staticmethod
-    def extract_text(file_content: bytes) -> str:
+    def extract_text(file_content: FileContent) -> str:
         """Extrae texto de un PDF"""
+        return PDFProcessor.extract_text_and_metadata(file_content)[0]
+    
+    @staticmethod
+    def extract_text_and_metadata(file_content: FileContent) -> Tuple[str, Dict[str, Any]]:
+        """Extrae texto, número de páginas y propiedades de un PDF con un solo reader"""
+        if not (_HAS_PDFIUM or _HAS_PYPDF2 or _HAS_PDFPLUMBER):
+            raise ImportError("Se requiere pypdfium2, PyPDF2 o pdfplumber para procesar PDFs")
+        
         try:
-            import PyPDF2
-            
-            pdf_file = io.BytesIO(file_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            text_parts = []
-            for page in pdf_reader.pages:
-                text = page.extract_text()
-                if text:
-                    text_parts.append(text)
+            pdf_file = as_seekable_file(file_content)
             
-            return "\n\n".join(text_parts)
+            if _HAS_PDFIUM:
+                return PDFProcessor._extract_with_pdfium(pdf_file)
             
-        except ImportError:
             # Fallback a pdfplumber si PyPDF2 no está disponible
-            try:
-                import pdfplumber
-                
-                pdf_file = io.BytesIO(file_content)
+            if not _HAS_PYPDF2:
                 text_parts = []
                 
                 with pdfplumber.open(pdf_file) as pdf:
@@ -68,25 +170,85 @@ class PDFProcessor:
                         text = page.extract_text()
                         if text:
                             text_parts.append(text)
+                    metadata = {"page_count": len(pdf.pages)}
                 
-                return "\n\n".join(text_parts)
-                
-            except ImportError:
-                raise ImportError("Se requiere PyPDF2 o pdfplumber para procesar PDFs")
+                return "\n\n".join(text_parts), metadata
+            
+            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            
+            text_parts = []
+            for page in pdf_reader.pages:
+                text = page.extract_text()
+                if text:
+                    text_parts.append(text)
+            
+            metadata = {"page_count": len(pdf_reader.pages)}
+            try:
+                # Materializar el diccionario de info una vez (cada acceso a
+                # pdf_reader.metadata lo vuelve a resolver)
+                info = dict(pdf_reader.metadata or {})
+                if info:
+                    metadata["title"] = info.get('/Title')
+                    metadata["author"] = info.get('/Author')
+                    metadata["subject"] = info.get('/Subject')
+                    metadata["creator"] = info.get('/Creator')
+            except Exception:
+                # Un diccionario de propiedades corrupto no invalida el texto
+                pass
+            
+            return "\n\n".join(text_parts), metadata
+            
         except Exception as e:
             raise Exception(f"Error procesando PDF: {str(e)}")
+    
+    @staticmethod
+    def _extract_with_pdfium(pdf_file: BinaryIO) -> Tuple[str, Dict[str, Any]]:
+        """
+        Extrae texto y metadatos con PDFium (C++), bastante más rápido que PyPDF2
+        
+        Las páginas se procesan en secuencia: PDFium no es thread-safe y
+        pypdfium2 serializa las llamadas, así que un pool de threads no
+        aportaría paralelismo real
+        """
+        pdf = pdfium.PdfDocument(pdf_file)
+        try:
+            text_parts = []
+            for page in pdf:
+                textpage = page.get_textpage()
+                text = textpage.get_text_range()
+                textpage.close()
+                page.close()
+                if text:
+                    text_parts.append(text)
+            
+            metadata = {"page_count": len(pdf)}
+            try:
+                properties = pdf.get_metadata_dict(skip_empty=True)
+                if properties:
+                    metadata["title"] = properties.get('Title')
+                    metadata["author"] = properties.get('Author')
+                    metadata["subject"] = properties.get('Subject')
+                    metadata["creator"] = properties.get('Creator')
+            except Exception:
+                # Un diccionario de propiedades corrupto no invalida el texto
+                pass
+            
+            return "\n\n".join(text_parts), metadata
+        finally:
+            pdf.close()
 
 
 class DocxProcessor:
     """Procesador para archivos Word (.docx)"""
     
     @staticmethod
-    def extract_text(file_content: bytes) -> str:
+    def extract_text(file_content: FileContent) -> str:
         """Extrae texto de un archivo Word"""
+        if not _HAS_DOCX:
+            raise ImportError("Se requiere python-docx para procesar archivos Word")
+        
         try:
-            from docx import Document
-            
-            docx_file = io.BytesIO(file_content)
+            docx_file = as_seekable_file(file_content)
             doc = Document(docx_file)
             
             text_parts = []
@@ -96,8 +258,6 @@ class DocxProcessor:
             
             return "\n\n".join(text_parts)
             
-        except ImportError:
-            raise ImportError("Se requiere python-docx para procesar archivos Word")
         except Exception as e:
             raise Exception(f"Error procesando DOCX: {str(e)}")
 
@@ -106,19 +266,27 @@ class TextProcessor:
     """Procesador para archivos de texto plano"""
     
     @staticmethod
-    def extract_text(file_content: bytes) -> str:
+    def extract_text(file_content: FileContent) -> str:
         """Extrae texto de un archivo de texto plano"""
         try:
-            # Intentar diferentes encodings
-            encodings = ['utf-8', 'latin-1', 'cp1252']
+            file_content = read_bytes(file_content)
+            
+            # UTF-8 con BOM
+            if file_content.startswith(b'\xef\xbb\xbf'):
+                return file_content[3:].decode('utf-8', errors='replace')
+            
+            # UTF-8 estricto: caso habitual, una sola decodificación
+            try:
+                return file_content.decode('utf-8')
+            except UnicodeDecodeError:
+                pass
             
-            for encoding in encodings:
-                try:
-                    return file_content.decode(encoding)
-                except UnicodeDecodeError:
-                    continue
+            # UTF-16 con BOM (p.ej. archivos exportados desde Windows)
+            if file_content.startswith((b'\xff\xfe', b'\xfe\xff')):
+                return file_content.decode('utf-16', errors='replace')
             
-            raise ValueError("No se pudo decodificar el archivo con los encodings disponibles")
+            # Cualquier otro caso: cp1252 (superconjunto práctico de latin-1)
+            return file_content.decode('cp1252', errors='replace')
             
         except Exception as e:
             raise Exception(f"Error procesando archivo de texto: {str(e)}")
@@ -128,39 +296,56 @@ class HTMLProcessor:
     """Procesador para archivos HTML"""
     
     @staticmethod
-    def extract_text(file_content: bytes) -> str:
-        """Extrae texto de un archivo HTML"""
+    def extract_text(file_content: FileContent) -> str:
+        """Extrae texto de un archivo HTML (selectolax, o BeautifulSoup como fallback)"""
+        if not (_HAS_SELECTOLAX or _HAS_BS4):
+            raise ImportError("Se requiere selectolax o beautifulsoup4 para procesar archivos HTML")
+        
         try:
-            from bs4 import BeautifulSoup
-            
-            html_content = file_content.decode('utf-8')
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # Remover scripts y estilos
-            for script in soup(["script", "style"]):
-                script.decompose()
+            html_content = read_bytes(file_content).decode('utf-8')
             
-            # Obtener texto
-            text = soup.get_text()
-            
-            # Limpiar espacios en blanco excesivos
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = '\n'.join(chunk for chunk in chunks if chunk)
+            if _HAS_SELECTOLAX:
+                # Parser en C (lexbor), mucho más rápido que html.parser
+                tree = LexborHTMLParser(html_content)
+                
+                # Remover scripts y estilos
+                for node in tree.css('script, style'):
+                    node.decompose()
+                
+                # Sin separador entre nodos de texto, como get_text(): los
+                # inline (<b>, <a>...) no parten palabras ni añaden espacios
+                root = tree.body if tree.body is not None else tree.root
+                text = root.text(deep=True, separator='') if root is not None else ''
+            else:
+                soup = BeautifulSoup(html_content, 'html.parser')
+                
+                # Remover scripts y estilos
+                for script in soup(["script", "style"]):
+                    script.decompose()
+                
+                text = soup.get_text()
             
-            return text
+            return _normalize_html_text(text)
             
-        except ImportError:
-            raise ImportError("Se requiere beautifulsoup4 para procesar archivos HTML")
         except Exception as e:
             raise Exception(f"Error procesando HTML: {str(e)}")
 
 
+def _normalize_html_text(text: str) -> str:
+    """
+    Limpia espacios en blanco excesivos del texto extraído de un HTML
+    
+    Cada tramo de espacios que contiene un salto de línea o dos espacios
+    seguidos se reduce a un único salto de línea, en una sola pasada
+    """
+    return _HTML_BREAK_RE.sub('\n', text).strip()
+
+
 def get_metadata_from_file(
     filename: str,
     file_size: int,
-    file_content: bytes,
-    file_extension: str
+    file_extension: str,
+    document_metadata: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """
     Extrae metadatos básicos de un archivo
@@ -168,8 +353,9 @@ def get_metadata_from_file(
     Args:
         filename: Nombre del archivo
         file_size: Tamaño en bytes
-        file_content: Contenido del archivo
         file_extension: Extensión del archivo
+        document_metadata: Metadatos obtenidos al extraer el texto
+            (ver DocumentProcessor.extract_text_and_metadata)
         
     Returns:
         Diccionario con metadatos
@@ -180,21 +366,10 @@ def get_metadata_from_file(
         "file_extension": file_extension
     }
     
-    # Metadatos específicos para PDFs
-    if file_extension.lower() == '.pdf':
-        try:
-            import PyPDF2
-            pdf_file = io.BytesIO(file_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            metadata["page_count"] = len(pdf_reader.pages)
-            
-            if pdf_reader.metadata:
-                metadata["title"] = pdf_reader.metadata.get('/Title', filename)
-                metadata["author"] = pdf_reader.metadata.get('/Author')
-                metadata["subject"] = pdf_reader.metadata.get('/Subject')
-                metadata["creator"] = pdf_reader.metadata.get('/Creator')
-        except:
-            pass
+    if document_metadata:
+        metadata.update(document_metadata)
+        # Los PDFs sin título usan el nombre del archivo
+        if "title" in metadata and metadata["title"] is None:
+            metadata["title"] = filename
     
     return metadata
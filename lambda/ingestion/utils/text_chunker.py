@@ -1,9 +1,27 @@
 """
 Text chunking utilities usando LangChain
 """
-from typing import List, Dict, Any
+import re
+from typing import Dict, Iterator, Tuple
 from dataclasses import dataclass
 
+# LangChain es opcional: sin él se usa simple_chunk_text
+try:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    _HAS_LANGCHAIN = True
+except ImportError:
+    _HAS_LANGCHAIN = False
+
+# Splitters ya construidos por (chunk_size, chunk_overlap, separator): en un
+# contenedor caliente la configuración viene del entorno y no cambia
+_SPLITTER_CACHE: Dict[Tuple[int, int, str], "RecursiveCharacterTextSplitter"] = {}
+
+# Chunks por ventana de texto que se pasa de una vez al splitter
+WINDOW_CHUNKS = 64
+
+# Espacios en blanco consecutivos (incluye saltos de línea)
+_WS_RE = re.compile(r'\s+')
+
 
 @dataclass
 class TextChunk:
@@ -19,10 +37,13 @@ def chunk_text(
     chunk_size: int = 800,
     chunk_overlap: int = 100,
     separator: str = "\n\n"
-) -> List[TextChunk]:
+) -> Iterator[TextChunk]:
     """
     Divide un texto en chunks usando RecursiveCharacterTextSplitter
     
+    Los chunks se generan de forma perezosa: el texto se divide por ventanas
+    de WINDOW_CHUNKS chunks, así que nunca están todos en memoria a la vez
+    
     Args:
         text: Texto a dividir
         chunk_size: Tamaño aproximado de cada chunk en caracteres
@@ -30,102 +51,115 @@ def chunk_text(
         separator: Separador principal para dividir
         
     Returns:
-        Lista de TextChunk objects
+        Iterador de TextChunk objects, en orden
     """
-    try:
-        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    # Fallback simple si LangChain no está disponible
+    if not _HAS_LANGCHAIN:
+        yield from simple_chunk_text(text, chunk_size, chunk_overlap)
+        return
+    
+    text_splitter = _get_splitter(chunk_size, chunk_overlap, separator)
+    
+    text_len = len(text)
+    window_size = chunk_size * WINDOW_CHUNKS
+    window_start = 0
+    chunk_index = 0
+    
+    while window_start < text_len:
+        window_end = min(window_start + window_size, text_len)
+        documents = text_splitter.create_documents([text[window_start:window_end]])
         
-        # Configurar el splitter
+        # El último chunk de una ventana intermedia puede quedar cortado por
+        # el límite de la ventana: se vuelve a dividir al inicio de la siguiente
+        next_start = window_end
+        if window_end < text_len and len(documents) > 1:
+            next_start = window_start + documents[-1].metadata['start_index']
+            if next_start <= window_start:
+                # start_index sale de text.find() y es -1 si el chunk no aparece
+                # tal cual: se conserva el último chunk y se avanza a la
+                # siguiente ventana (retroceder duplicaría chunks o no avanzaría)
+                next_start = window_end
+            else:
+                documents = documents[:-1]
+        
+        for document in documents:
+            content = document.page_content
+            start_pos = window_start + document.metadata['start_index']
+            yield TextChunk(
+                content=content,
+                start_char=start_pos,
+                end_char=start_pos + len(content),
+                chunk_index=chunk_index
+            )
+            chunk_index += 1
+        
+        window_start = next_start
+
+
+def _get_splitter(
+    chunk_size: int,
+    chunk_overlap: int,
+    separator: str
+) -> "RecursiveCharacterTextSplitter":
+    """Splitter configurado, creado una vez por contenedor y configuración"""
+    key = (chunk_size, chunk_overlap, separator)
+    text_splitter = _SPLITTER_CACHE.get(key)
+    if text_splitter is None:
+        # add_start_index calcula la posición de cada chunk durante la
+        # división, sin volver a buscarlo en el texto
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             separators=[separator, "\n", ". ", " ", ""],
-            length_function=len
+            length_function=len,
+            add_start_index=True
         )
-        
-        # Dividir el texto
-        chunks = text_splitter.split_text(text)
-        
-        # Crear objetos TextChunk con información de posición
-        result_chunks = []
-        current_position = 0
-        
-        for i, chunk_content in enumerate(chunks):
-            # Encontrar la posición del chunk en el texto original
-            start_pos = text.find(chunk_content, current_position)
-            if start_pos == -1:
-                start_pos = current_position
-            
-            end_pos = start_pos + len(chunk_content)
-            
-            result_chunks.append(TextChunk(
-                content=chunk_content,
-                start_char=start_pos,
-                end_char=end_pos,
-                chunk_index=i
-            ))
-            
-            current_position = end_pos
-        
-        return result_chunks
-        
-    except ImportError:
-        # Fallback simple si LangChain no está disponible
-        return simple_chunk_text(text, chunk_size, chunk_overlap)
+        _SPLITTER_CACHE[key] = text_splitter
+    return text_splitter
 
 
 def simple_chunk_text(
     text: str,
     chunk_size: int = 800,
     chunk_overlap: int = 100
-) -> List[TextChunk]:
+) -> Iterator[TextChunk]:
     """
     División simple de texto sin dependencias externas
     Usado como fallback si LangChain no está disponible
     """
-    chunks = []
     start = 0
     chunk_index = 0
+    text_len = len(text)
+    rfind = text.rfind
     
-    while start < len(text):
+    while start < text_len:
         end = start + chunk_size
         
         # Si no es el último chunk, intentar cortar en un espacio
-        if end < len(text):
+        if end < text_len:
             # Buscar el último espacio antes del límite
-            last_space = text.rfind(' ', start, end)
+            last_space = rfind(' ', start, end)
             if last_space > start:
                 end = last_space
         
         chunk_content = text[start:end].strip()
         
         if chunk_content:
-            chunks.append(TextChunk(
+            yield TextChunk(
                 content=chunk_content,
                 start_char=start,
                 end_char=end,
                 chunk_index=chunk_index
-            ))
+            )
             chunk_index += 1
         
-        # Mover el inicio con overlap
-        start = end - chunk_overlap if end < len(text) else end
-    
-    return chunks
-
-
-def estimate_tokens(text: str) -> int:
-    """
-    Estima el número de tokens en un texto
-    Aproximación: 1 token ≈ 4 caracteres
-    
-    Args:
-        text: Texto a analizar
+        if end >= text_len:
+            break
         
-    Returns:
-        Estimación del número de tokens
-    """
-    return len(text) // 4
+        # Mover el inicio con overlap, avanzando siempre: si el corte en un
+        # espacio deja el chunk más corto que el overlap, no se retrocede
+        next_start = end - chunk_overlap
+        start = next_start if next_start > start else end
 
 
 def clean_text(text: str) -> str:
@@ -138,13 +172,9 @@ def clean_text(text: str) -> str:
     Returns:
         Texto limpio
     """
-    import re
-    
-    # Remover espacios en blanco excesivos
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Remover líneas vacías múltiples
-    text = re.sub(r'\n\s*\n', '\n\n', text)
+    # Remover espacios en blanco excesivos. Una sola pasada: al colapsar
+    # también los saltos de línea ya no quedan líneas vacías múltiples
+    text = _WS_RE.sub(' ', text)
     
     # Trim
     text = text.strip()
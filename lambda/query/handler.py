@@ -3,16 +3,35 @@ AWS Lambda Handler para Query y Generación de Respuestas
 Recibe consultas, busca documentos relevantes y genera respuestas con LLM
 """
 import json
+import logging
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List, Optional
 
+# orjson (opcional) serializa y parsea JSON bastante más rápido que json
+try:
+    import orjson
+    
+    def _dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+    
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+    
+    _loads = json.loads
+
 # Importar utilidades locales
 from utils.prompt_builder import (
     build_rag_prompt,
     format_response_with_sources,
     sanitize_query
 )
+from utils.cache import get_cache, should_use_cache
+from utils.semantic_cache import get_semantic_cache
+from utils.reranking import mmr_rerank
 
 # Importar clientes compartidos
 import sys
@@ -20,19 +39,45 @@ sys.path.append('/opt/python')  # Para Lambda Layers
 
 try:
     from shared.utils.bedrock_client import get_bedrock_client
-    from shared.utils.postgres_client import PostgresVectorClient
+    from shared.utils.postgres_client import get_postgres_client
 except ImportError as e:
     print(f"Warning: No se pudieron importar shared utilities: {e}")
 
 
+# Logger del módulo (nivel configurable con LOG_LEVEL, p.ej. DEBUG o WARNING)
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
 # Variables de entorno
 DB_SECRET_ARN = os.environ.get('DB_SECRET_ARN')
 DB_NAME = os.environ.get('DB_NAME', 'ragdb')
+# Definidas solo cuando se despliega con RDS Proxy (autenticación IAM)
+DB_ENDPOINT = os.environ.get('DB_ENDPOINT')
+DB_USER = os.environ.get('DB_USER')
+# Índice HNSW en media precisión (embedding::halfvec); igual que en el Lambda de Ingesta
+HALFVEC_INDEX = os.environ.get('HALFVEC_INDEX', 'false').lower() == 'true'
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
 BEDROCK_EMBEDDING_MODEL = os.environ.get('BEDROCK_EMBEDDING_MODEL', 'amazon.titan-embed-text-v2:0')
 BEDROCK_LLM_MODEL = os.environ.get('BEDROCK_LLM_MODEL', 'anthropic.claude-3-sonnet-20240229-v1:0')
 TOP_K = int(os.environ.get('TOP_K', '5'))
 MIN_SIMILARITY = float(os.environ.get('MIN_SIMILARITY', '0.1'))
+USE_CACHE = os.environ.get('USE_CACHE', 'true').lower() == 'true'
+# Caché semántico: reutiliza la respuesta de una consulta casi idéntica
+# (similitud del embedding >= SEMANTIC_CACHE_THRESHOLD). Opcional porque dos
+# preguntas muy parecidas pueden requerir respuestas distintas
+USE_SEMANTIC_CACHE = os.environ.get('USE_SEMANTIC_CACHE', 'false').lower() == 'true'
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.95'))
+# Re-ranking MMR: se recuperan MMR_FETCH_FACTOR * top_k candidatos y se eligen
+# top_k equilibrando relevancia (MMR_LAMBDA) y diversidad
+USE_MMR = os.environ.get('USE_MMR', 'true').lower() == 'true'
+MMR_FETCH_FACTOR = int(os.environ.get('MMR_FETCH_FACTOR', '3'))
+MMR_LAMBDA = float(os.environ.get('MMR_LAMBDA', '0.5'))
+# Caché de prompts de Bedrock para las instrucciones fijas (solo en modelos
+# que lo soportan, p.ej. Claude 3.5 Sonnet v2 / 3.7 Sonnet)
+PROMPT_CACHING = os.environ.get('PROMPT_CACHING', 'false').lower() == 'true'
+
+# Pool reutilizado entre invocaciones para solapar llamadas de red
+_executor = ThreadPoolExecutor(max_workers=2)
 
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -46,7 +91,11 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Returns:
         Respuesta con la respuesta generada y fuentes
     """
-    print(f"Evento recibido: {json.dumps(event)}")
+    # El evento completo solo se serializa en DEBUG; en INFO basta un resumen
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Evento recibido: %s", _dumps(event))
+    else:
+        logger.info("Evento recibido: %s %s", event.get('httpMethod'), event.get('path'))
     
     start_time = time.time()
     
@@ -54,7 +103,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         # Parsear body
         body = event.get('body', {})
         if isinstance(body, str):
-            body = json.loads(body)
+            body = _loads(body)
         
         # Validar parámetros
         if 'query' not in body:
@@ -68,8 +117,8 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         min_similarity = body.get('min_similarity', MIN_SIMILARITY)
         include_sources = body.get('include_sources', True)
         
-        print(f"Query: {query}")
-        print(f"Top-K: {top_k}, Min Similarity: {min_similarity}")
+        logger.info("Query: %s", query)
+        logger.info("Top-K: %s, Min Similarity: %s", top_k, min_similarity)
         
         # Procesar query
         result = process_query(
@@ -85,15 +134,37 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return success_response(result)
         
     except ValueError as e:
-        print(f"Error de validación: {str(e)}")
+        logger.warning("Error de validación: %s", e)
         return error_response(400, str(e))
     except Exception as e:
-        print(f"Error en lambda_handler: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error en lambda_handler: %s", e)
         return error_response(500, f"Error procesando consulta: {str(e)}")
 
 
+def _get_pg_client():
+    """
+    Cliente de PostgreSQL reutilizado entre invocaciones, con la conexión ya
+    verificada
+    
+    Se ejecuta en _executor mientras se genera el embedding: en un arranque en
+    frío oculta la conexión inicial y, en caliente, el ping (y la reconexión si
+    el servidor cerró la conexión inactiva) queda detrás de la llamada a Bedrock.
+    """
+    pg_client = get_postgres_client(
+        db_secret_arn=DB_SECRET_ARN,
+        db_name=DB_NAME,
+        region=AWS_REGION,
+        host=DB_ENDPOINT,
+        username=DB_USER,
+        iam_auth=bool(DB_ENDPOINT),
+        # Detrás de RDS Proxy, PREPARE fijaría la sesión al cliente
+        prepared_statements=not DB_ENDPOINT,
+        halfvec_index=HALFVEC_INDEX
+    )
+    pg_client.ping()
+    return pg_client
+
+
 def process_query(
     query: str,
     filters: Optional[Dict[str, Any]] = None,
@@ -116,31 +187,120 @@ def process_query(
     Returns:
         Diccionario con respuesta y metadatos
     """
-    # 1. Generar embedding de la query
-    print("Generando embedding de la consulta...")
+    # 0. Consultar el caché del contenedor antes de llamar a Bedrock. Los
+    # parámetros de búsqueda forman parte de la clave porque cambian el resultado
+    cache = get_cache() if USE_CACHE and should_use_cache(query) else None
+    cache_params = {
+        'filters': filters,
+        'top_k': top_k,
+        'min_similarity': min_similarity,
+        'include_sources': include_sources
+    }
+    if cache is not None:
+        cached = cache.get(query, cache_params)
+        if cached is not None:
+            logger.info("Respuesta obtenida del caché")
+            return {**cached, 'from_cache': True}
+    
+    # 1. Generar embedding de la query mientras se abre la conexión a
+    # PostgreSQL en paralelo (ambas son llamadas de red independientes)
+    pg_future = _executor.submit(_get_pg_client)
+    query_embedding = _embed_query(query)
+    
+    # 1b. Con el mismo embedding, buscar una consulta casi idéntica ya respondida
+    semantic_cache = (
+        get_semantic_cache(SEMANTIC_CACHE_THRESHOLD)
+        if cache is not None and USE_SEMANTIC_CACHE else None
+    )
+    if semantic_cache is not None:
+        cached = semantic_cache.get(query_embedding, cache_params)
+        if cached is not None:
+            logger.info("Respuesta obtenida del caché semántico")
+            return {**cached, 'from_cache': True}
+    
+    # 2-5. Búsqueda, construcción del prompt y generación
+    result = _retrieve_and_generate(
+        query=query,
+        query_embedding=query_embedding,
+        pg_client=pg_future.result(),
+        filters=filters,
+        top_k=top_k,
+        min_similarity=min_similarity,
+        include_sources=include_sources
+    )
+    
+    if cache is not None and result['num_sources']:
+        cache.set(query, dict(result), cache_params)
+        if semantic_cache is not None:
+            semantic_cache.set(query_embedding, dict(result), cache_params)
+    
+    result['from_cache'] = False
+    return result
+
+
+def _embed_query(query: str) -> List[float]:
+    """
+    Genera el embedding de la consulta
+    
+    Args:
+        query: Consulta del usuario (ya sanitizada)
+        
+    Returns:
+        Vector de embedding de la consulta
+    """
+    logger.debug("Generando embedding de la consulta...")
     bedrock_client = get_bedrock_client(region_name=AWS_REGION)
     
     query_embedding = bedrock_client.generate_embeddings(
         text=query,
-        model_id=BEDROCK_EMBEDDING_MODEL
+        model_id=BEDROCK_EMBEDDING_MODEL,
+        input_type="search_query"
     )
     
-    print(f"Embedding generado. Dimensión: {len(query_embedding)}")
+    logger.debug("Embedding generado. Dimensión: %d", len(query_embedding))
+    return query_embedding
+
+
+def _retrieve_and_generate(
+    query: str,
+    query_embedding: List[float],
+    pg_client: Any,
+    filters: Optional[Dict[str, Any]],
+    top_k: int,
+    min_similarity: float,
+    include_sources: bool
+) -> Dict[str, Any]:
+    """
+    Recupera los chunks relevantes para un embedding ya calculado y genera la
+    respuesta con el LLM
     
+    Args:
+        query: Consulta del usuario
+        query_embedding: Embedding de la consulta
+        pg_client: Cliente de PostgreSQL conectado
+        filters: Filtros de metadatos opcionales
+        top_k: Número de chunks a usar en el prompt
+        min_similarity: Similitud mínima requerida
+        include_sources: Si incluir fuentes en la respuesta
+        
+    Returns:
+        Diccionario con respuesta y metadatos
+    """
     # 2. Buscar documentos relevantes en PostgreSQL
-    print(f"Buscando documentos similares en PostgreSQL...")
-    with PostgresVectorClient(
-        db_secret_arn=DB_SECRET_ARN,
-        db_name=DB_NAME,
-        region=AWS_REGION
-    ) as pg_client:
-        documents = pg_client.search_similar(
-            query_embedding=query_embedding,
-            top_k=top_k,
-            min_similarity=min_similarity
-        )
+    logger.debug("Buscando documentos similares en PostgreSQL...")
+    documents = pg_client.search_similar(
+        query_embedding=query_embedding,
+        top_k=top_k * MMR_FETCH_FACTOR if USE_MMR else top_k,
+        min_similarity=min_similarity,
+        include_embeddings=USE_MMR,
+        filters=filters
+    )
+    
+    if USE_MMR:
+        # Descartar chunks casi duplicados antes de construir el prompt
+        documents = mmr_rerank(documents, top_k=top_k, lambda_mult=MMR_LAMBDA)
     
-    print(f"Se encontraron {len(documents)} documentos relevantes")
+    logger.info("Se encontraron %d documentos relevantes", len(documents))
     
     # Si no hay documentos relevantes
     if not documents:
@@ -152,31 +312,32 @@ def process_query(
         }
     
     # 3. Construir prompt con contexto
-    print("Construyendo prompt...")
-    prompt = build_rag_prompt(
+    logger.debug("Construyendo prompt...")
+    system_prompt, prompt = build_rag_prompt(
         query=query,
         documents=documents
     )
     
     # 4. Generar respuesta con LLM
-    print("Generando respuesta con Claude...")
+    logger.debug("Generando respuesta con Claude...")
+    bedrock_client = get_bedrock_client(region_name=AWS_REGION)
     response_text = bedrock_client.generate_response(
         prompt=prompt,
+        system_prompt=system_prompt,
         model_id=BEDROCK_LLM_MODEL,
         temperature=0.2,
-        max_tokens=2048
+        max_tokens=2048,
+        cache_system_prompt=PROMPT_CACHING
     )
     
-    print("Respuesta generada")
+    logger.debug("Respuesta generada")
     
     # 5. Formatear respuesta con fuentes
-    result = format_response_with_sources(
+    return format_response_with_sources(
         response_text=response_text,
         documents=documents,
         include_sources=include_sources
     )
-    
-    return result
 
 
 def error_response(status_code: int, message: str) -> Dict[str, Any]:
@@ -187,7 +348,7 @@ def error_response(status_code: int, message: str) -> Dict[str, Any]:
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
         },
-        'body': json.dumps({
+        'body': _dumps({
             'error': message
         })
     }
@@ -201,6 +362,6 @@ def success_response(data: Dict[str, Any]) -> Dict[str, Any]:
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
         },
-        'body': json.dumps(data, ensure_ascii=False)
+        'body': _dumps(data)
     }
 
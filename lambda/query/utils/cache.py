@@ -3,8 +3,10 @@ Utilidades para caché de resultados y optimización
 """
 import json
 import hashlib
+import re
+import time
+from collections import OrderedDict
 from typing import Optional, Dict, Any, List
-from datetime import datetime, timedelta
 
 
 class SimpleCache:
@@ -21,14 +23,28 @@ class SimpleCache:
             max_size: Número máximo de elementos en caché
             ttl_minutes: Tiempo de vida en minutos
         """
-        self.cache: Dict[str, Dict[str, Any]] = {}
+        # Orden de inserción = orden de uso (el más reciente al final)
+        self.cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
         self.max_size = max_size
-        self.ttl = timedelta(minutes=ttl_minutes)
+        # TTL en segundos, comparado con time.monotonic() (no depende del reloj de pared)
+        self.ttl_seconds = ttl_minutes * 60.0
     
     def _generate_key(self, query: str, filters: Optional[Dict] = None) -> str:
-        """Genera una clave única para una consulta"""
-        data = f"{query}:{json.dumps(filters or {}, sort_keys=True)}"
-        return hashlib.md5(data.encode()).hexdigest()
+        """
+        Genera una clave única para una consulta
+        
+        Usa BLAKE2b de 128 bits sobre la consulta y los filtros ordenados por
+        clave. Solo los valores anidados (dict) se serializan con JSON, el resto
+        se representa con repr().
+        """
+        h = hashlib.blake2b(query.encode(), digest_size=16)
+        if filters:
+            for name in sorted(filters):
+                value = filters[name]
+                if isinstance(value, dict):
+                    value = json.dumps(value, sort_keys=True)
+                h.update(f"\x00{name}\x00{value!r}".encode())
+        return h.hexdigest()
     
     def get(self, query: str, filters: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
         """
@@ -47,8 +63,9 @@ class SimpleCache:
             entry = self.cache[key]
             
             # Verificar expiración
-            if datetime.now() - entry['timestamp'] < self.ttl:
+            if time.monotonic() - entry['timestamp'] < self.ttl_seconds:
                 entry['hits'] += 1
+                self.cache.move_to_end(key)
                 return entry['data']
             else:
                 # Eliminar entrada expirada
@@ -67,25 +84,18 @@ class SimpleCache:
         """
         key = self._generate_key(query, filters)
         
-        # Si el caché está lleno, eliminar el elemento menos usado
-        if len(self.cache) >= self.max_size:
-            self._evict_lru()
+        # Si el caché está lleno, eliminar el elemento menos recientemente usado
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        elif len(self.cache) >= self.max_size:
+            self.cache.popitem(last=False)
         
         self.cache[key] = {
             'data': data,
-            'timestamp': datetime.now(),
+            'timestamp': time.monotonic(),
             'hits': 0
         }
     
-    def _evict_lru(self):
-        """Elimina el elemento menos recientemente usado"""
-        if not self.cache:
-            return
-        
-        # Encontrar el elemento con menos hits
-        lru_key = min(self.cache.items(), key=lambda x: x[1]['hits'])[0]
-        del self.cache[lru_key]
-    
     def clear(self):
         """Limpia todo el caché"""
         self.cache.clear()
@@ -98,10 +108,16 @@ class SimpleCache:
             'size': len(self.cache),
             'max_size': self.max_size,
             'total_hits': total_hits,
-            'ttl_minutes': self.ttl.total_seconds() / 60
+            'ttl_minutes': self.ttl_seconds / 60
         }
 
 
+# Palabras que indican una consulta dependiente del momento; una sola
+# alternación compilada recorre la consulta una vez en lugar de una por palabra
+_TEMPORAL_KEYWORDS = ('hoy', 'ahora', 'actual', 'último', 'reciente')
+_TEMPORAL_RE = re.compile('|'.join(_TEMPORAL_KEYWORDS), re.IGNORECASE)
+
+
 # Instancia global del caché (persistente durante la vida del contenedor Lambda)
 _query_cache = SimpleCache(max_size=100, ttl_minutes=30)
 
@@ -126,11 +142,7 @@ def should_use_cache(query: str) -> bool:
         return False
     
     # No cachear queries con instrucciones temporales
-    temporal_keywords = ['hoy', 'ahora', 'actual', 'último', 'reciente']
-    query_lower = query.lower()
-    
-    for keyword in temporal_keywords:
-        if keyword in query_lower:
-            return False
+    if _TEMPORAL_RE.search(query):
+        return False
     
     return True
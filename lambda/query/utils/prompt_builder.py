@@ -1,39 +1,32 @@
 """
 Utilidades para construcción de prompts y generación de respuestas
 """
-from typing import List, Dict, Any, Optional
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 
+# Palabras comunes a ignorar (stopwords español)
+_STOPWORDS = frozenset({
+    'el', 'la', 'de', 'que', 'y', 'a', 'en', 'un', 'ser', 'se', 'no',
+    'haber', 'por', 'con', 'su', 'para', 'como', 'estar', 'tener',
+    'le', 'lo', 'todo', 'pero', 'más', 'hacer', 'o', 'poder', 'decir',
+    'este', 'ir', 'otro', 'ese', 'la', 'si', 'me', 'ya', 'ver', 'porque',
+    'dar', 'cuando', 'él', 'muy', 'sin', 'vez', 'mucho', 'saber', 'qué',
+    'sobre', 'mi', 'alguno', 'mismo', 'yo', 'también', 'hasta', 'año',
+    'dos', 'querer', 'entre', 'así', 'primero', 'desde', 'grande', 'eso',
+    'ni', 'nos', 'llegar', 'pasar', 'tiempo', 'ella', 'sí', 'día', 'uno',
+    'bien', 'poco', 'deber', 'entonces', 'poner', 'cosa', 'tanto', 'hombre',
+    'parecer', 'nuestro', 'tan', 'donde', 'ahora', 'parte', 'después', 'vida',
+    'es', 'del', 'los', 'las', 'una', 'al', 'son', 'cómo', 'cuál', 'cuáles'
+})
 
-def build_rag_prompt(
-    query: str,
-    documents: List[Dict[str, Any]]
-) -> str:
-    """
-    Construye el prompt para el modelo LLM incluyendo contexto recuperado
-    
-    Args:
-        query: Pregunta del usuario
-        documents: Lista de documentos relevantes de PostgreSQL
-        
-    Returns:
-        Prompt completo para el LLM
-    """
-    # Construir contexto a partir de los documentos
-    context_parts = []
-    for i, doc in enumerate(documents, 1):
-        metadata = doc.get('metadata', {})
-        filename = metadata.get('filename', 'documento desconocido') if metadata else 'documento'
-        content = doc.get('content', '')
-        similarity = doc.get('similarity', 0)
-        
-        context_parts.append(
-            f"[Fuente {i}: {filename} (similitud: {similarity:.2f})]\n{content}\n"
-        )
-    
-    context_text = "\n---\n".join(context_parts)
-    
-    # Prompt completo
-    prompt = f"""Eres un asistente experto que responde preguntas basándose únicamente en el contexto proporcionado.
+_WORD_RE = re.compile(r'\b\w+\b')
+_WS_RE = re.compile(r'\s+')
+# Palabras de 4+ caracteres: el filtro de longitud se hace dentro de la regex
+_KEYWORD_RE = re.compile(r'\b\w{4,}\b')
+
+# Instrucciones de sistema (constantes: se construyen una sola vez por contenedor)
+RAG_SYSTEM_PROMPT = """Eres un asistente experto que responde preguntas basándose únicamente en el contexto proporcionado.
 
 Instrucciones:
 1. Responde SOLO basándote en la información del contexto proporcionado
@@ -41,11 +34,22 @@ Instrucciones:
 3. Sé conciso pero completo en tus respuestas
 4. Si citas información, menciona de qué documento proviene
 5. Mantén un tono profesional y claro
-6. No inventes información que no esté en el contexto
+6. No inventes información que no esté en el contexto"""
 
-Contexto de documentos relevantes:
+CONVERSATIONAL_SYSTEM_PROMPT = """Eres un asistente conversacional experto. Mantén una conversación natural 
+mientras respondes basándote en el contexto de documentos proporcionado.
 
-{context_text}
+Características de tus respuestas:
+- Natural y conversacional
+- Basadas en el contexto proporcionado
+- Considera el historial de la conversación
+- Admite cuando no tienes información suficiente
+- Mantén coherencia con respuestas anteriores"""
+
+# Plantilla del mensaje del usuario en build_rag_prompt
+_RAG_USER_TEMPLATE = """Contexto de documentos relevantes:
+
+{context}
 
 ---
 
@@ -53,7 +57,48 @@ Pregunta del usuario: {query}
 
 Por favor, responde la pregunta basándote únicamente en el contexto proporcionado arriba."""
 
-    return prompt
+# Separadores entre fragmentos de contexto
+_CONTEXT_SEP = "\n---\n"
+_CONVERSATIONAL_CONTEXT_SEP = "\n\n"
+
+
+def _source_filename(doc: Dict[str, Any], default: str) -> str:
+    """Nombre de archivo de un documento recuperado ('documento' si no tiene metadatos)"""
+    metadata = doc.get('metadata')
+    return metadata.get('filename', default) if metadata else 'documento'
+
+
+def build_rag_prompt(
+    query: str,
+    documents: List[Dict[str, Any]]
+) -> tuple[str, str]:
+    """
+    Construye el prompt para el modelo LLM incluyendo contexto recuperado
+    
+    Las instrucciones (fijas) van en el system prompt y el contexto recuperado
+    y la pregunta (variables) en el mensaje del usuario, de modo que el prefijo
+    de la petición es idéntico entre consultas y puede aprovechar el caché de
+    prompts del modelo.
+    
+    Args:
+        query: Pregunta del usuario
+        documents: Lista de documentos relevantes de PostgreSQL
+        
+    Returns:
+        Tupla de (system_prompt, user_prompt)
+    """
+    # Construir contexto a partir de los documentos (un solo join, sin lista
+    # intermedia de fragmentos)
+    context_text = _CONTEXT_SEP.join(
+        f"[Fuente {i}: {_source_filename(doc, 'documento desconocido')} "
+        f"(similitud: {doc.get('similarity', 0):.2f})]\n{doc.get('content', '')}\n"
+        for i, doc in enumerate(documents, 1)
+    )
+    
+    # Prompt del usuario (solo la parte variable)
+    user_prompt = _RAG_USER_TEMPLATE.format(context=context_text, query=query)
+    
+    return RAG_SYSTEM_PROMPT, user_prompt
 
 
 def build_conversational_prompt(
@@ -72,36 +117,23 @@ def build_conversational_prompt(
     Returns:
         Tupla de (system_prompt, user_prompt)
     """
-    system_prompt = """Eres un asistente conversacional experto. Mantén una conversación natural 
-mientras respondes basándote en el contexto de documentos proporcionado.
-
-Características de tus respuestas:
-- Natural y conversacional
-- Basadas en el contexto proporcionado
-- Considera el historial de la conversación
-- Admite cuando no tienes información suficiente
-- Mantén coherencia con respuestas anteriores"""
+    system_prompt = CONVERSATIONAL_SYSTEM_PROMPT
 
     # Construir contexto
-    context_parts = []
-    for i, chunk in enumerate(context_chunks, 1):
-        metadata = chunk.get('metadata', {})
-        filename = metadata.get('filename', 'documento')
-        content = chunk.get('content', '')
-        context_parts.append(f"[Documento {i}: {filename}]\n{content}")
-    
-    context_text = "\n\n".join(context_parts)
+    context_text = _CONVERSATIONAL_CONTEXT_SEP.join(
+        f"[Documento {i}: {(chunk.get('metadata', {}) or {}).get('filename', 'documento')}]\n"
+        f"{chunk.get('content', '')}"
+        for i, chunk in enumerate(context_chunks, 1)
+    )
     
-    # Construir historial si existe
+    # Construir historial si existe (últimos 5 mensajes)
     history_text = ""
     if conversation_history:
-        history_parts = []
-        for msg in conversation_history[-5:]:  # Últimos 5 mensajes
-            role = msg.get('role', 'user')
-            content = msg.get('content', '')
-            history_parts.append(f"{role.upper()}: {content}")
-        history_text = "\n".join(history_parts)
-        history_text = f"\n\nHistorial de conversación:\n{history_text}\n"
+        history_lines = "\n".join(
+            f"{msg.get('role', 'user').upper()}: {msg.get('content', '')}"
+            for msg in conversation_history[-5:]
+        )
+        history_text = f"\n\nHistorial de conversación:\n{history_lines}\n"
     
     user_prompt = f"""Contexto relevante:
 {context_text}
@@ -123,35 +155,44 @@ def extract_keywords(query: str) -> List[str]:
     Returns:
         Lista de palabras clave
     """
-    import re
+    # El resultado cacheado es una tupla; se devuelve una lista nueva para que
+    # el llamador pueda modificarla sin alterar el caché
+    return list(_extract_keywords_cached(query))
+
+
+@lru_cache(maxsize=1024)
+def _extract_keywords_cached(query: str) -> Tuple[str, ...]:
+    """Palabras clave de una consulta, memoizadas por texto de la consulta"""
+    # Limpiar y tokenizar
+    words = _WORD_RE.findall(query.lower())
     
-    # Palabras comunes a ignorar (stopwords español)
-    stopwords = {
-        'el', 'la', 'de', 'que', 'y', 'a', 'en', 'un', 'ser', 'se', 'no',
-        'haber', 'por', 'con', 'su', 'para', 'como', 'estar', 'tener',
-        'le', 'lo', 'todo', 'pero', 'más', 'hacer', 'o', 'poder', 'decir',
-        'este', 'ir', 'otro', 'ese', 'la', 'si', 'me', 'ya', 'ver', 'porque',
-        'dar', 'cuando', 'él', 'muy', 'sin', 'vez', 'mucho', 'saber', 'qué',
-        'sobre', 'mi', 'alguno', 'mismo', 'yo', 'también', 'hasta', 'año',
-        'dos', 'querer', 'entre', 'así', 'primero', 'desde', 'grande', 'eso',
-        'ni', 'nos', 'llegar', 'pasar', 'tiempo', 'ella', 'sí', 'día', 'uno',
-        'bien', 'poco', 'deber', 'entonces', 'poner', 'cosa', 'tanto', 'hombre',
-        'parecer', 'nuestro', 'tan', 'donde', 'ahora', 'parte', 'después', 'vida',
-        'es', 'del', 'los', 'las', 'una', 'al', 'son', 'cómo', 'cuál', 'cuáles'
-    }
+    # Filtrar palabras muy cortas y stopwords
+    return tuple(
+        word for word in words
+        if len(word) > 3 and word not in _STOPWORDS
+    )
+
+
+def extract_keywords_batch(queries: List[str]) -> List[List[str]]:
+    """
+    Extrae palabras clave de muchas consultas (p.ej. análisis de logs)
     
-    # Limpiar y tokenizar
-    query = query.lower()
-    words = re.findall(r'\b\w+\b', query)
+    Mismo resultado que llamar a extract_keywords por consulta, pero el filtro
+    de longitud se resuelve en la regex y los métodos se resuelven una sola vez
+    para todo el lote.
     
-    # Filtrar stopwords y palabras muy cortas
-    keywords = [
-        word for word in words 
-        if word not in stopwords and len(word) > 3
+    Args:
+        queries: Consultas de los usuarios
+        
+    Returns:
+        Lista de palabras clave por consulta, en el mismo orden
+    """
+    find_words = _KEYWORD_RE.findall
+    stopwords = _STOPWORDS
+    return [
+        [word for word in find_words(query) if word not in stopwords]
+        for query in map(str.lower, queries)
     ]
-    
-    return keywords
-
 
 def format_response_with_sources(
     response_text: str,
@@ -175,17 +216,31 @@ def format_response_with_sources(
     }
     
     if include_sources:
-        # Procesar fuentes únicas
-        sources = []
+        # Procesar fuentes únicas: los chunks de un mismo documento se agrupan
+        # bajo su parent_document_id en una sola pasada
+        unique_sources: Dict[str, Dict[str, Any]] = {}
         for doc in documents:
-            metadata = doc.get('metadata', {}) or {}
-            sources.append({
-                'document_id': doc.get('document_id'),
-                'filename': metadata.get('filename', 'Desconocido'),
-                'similarity': doc.get('similarity', 0)
+            metadata = doc.get('metadata') or {}
+            similarity = doc.get('similarity', 0)
+            source_id = metadata.get('parent_document_id') or doc.get('document_id')
+            
+            source = unique_sources.get(source_id)
+            if source is None:
+                source = unique_sources[source_id] = {
+                    'document_id': source_id,
+                    'filename': metadata.get('filename', 'Desconocido'),
+                    'similarity': similarity,
+                    'chunks_used': []
+                }
+            elif similarity > source['similarity']:
+                source['similarity'] = similarity
+            
+            source['chunks_used'].append({
+                'chunk_index': metadata.get('chunk_index', 0),
+                'similarity': similarity
             })
         
-        result['sources'] = sources
+        result['sources'] = list(unique_sources.values())
         result['confidence'] = documents[0].get('similarity', 0) if documents else 0.0
     
     return result
@@ -231,10 +286,14 @@ def calculate_response_confidence(
     }
 
 
+@lru_cache(maxsize=1024)
 def sanitize_query(query: str, max_length: int = 1000) -> str:
     """
     Sanitiza y valida una consulta del usuario
     
+    Función pura memoizada: las consultas repetidas (reintentos, preguntas
+    frecuentes) no vuelven a procesarse. Los ValueError no se cachean.
+    
     Args:
         query: Consulta original
         max_length: Longitud máxima permitida
@@ -242,15 +301,23 @@ def sanitize_query(query: str, max_length: int = 1000) -> str:
     Returns:
         Consulta sanitizada
     """
-    # Remover espacios excesivos
-    query = ' '.join(query.split())
-    
-    # Truncar si es muy largo
-    if len(query) > max_length:
-        query = query[:max_length]
+    # Remover espacios excesivos. Camino rápido: si no hay espacios dobles ni en
+    # los extremos y todo es imprimible (el único espacio imprimible es ' '), la
+    # consulta ya está normalizada y se evitan la regex y la copia
+    if not (
+        '  ' not in query
+        and query[:1] != ' '
+        and query[-1:] != ' '
+        and query.isprintable()
+    ):
+        query = _WS_RE.sub(' ', query).strip()
     
     # Validar que no esté vacío
-    if not query.strip():
+    if not query:
         raise ValueError("La consulta no puede estar vacía")
     
-    return query.strip()
+    # Truncar si es muy largo
+    if len(query) > max_length:
+        query = query[:max_length].rstrip()
+    
+    return query
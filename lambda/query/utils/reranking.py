@@ -0,0 +1,66 @@
+"""
+Re-ranking de resultados de búsqueda vectorial
+"""
+import math
+from operator import mul
+from typing import List, Dict, Any, Optional
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    """Devuelve el vector con norma 1 (o el mismo vector si es nulo)"""
+    norm = math.sqrt(sum(map(mul, vector, vector)))
+    if norm == 0:
+        return vector
+    return [x / norm for x in vector]
+
+
+def mmr_rerank(
+    documents: List[Dict[str, Any]],
+    top_k: int,
+    lambda_mult: float = 0.5
+) -> List[Dict[str, Any]]:
+    """
+    Selecciona documentos con Maximal Marginal Relevance (MMR)
+    
+    En cada paso elige el documento que maximiza
+    lambda * sim(query, doc) - (1 - lambda) * max(sim(doc, elegido)),
+    evitando enviar al LLM chunks casi duplicados.
+    
+    Args:
+        documents: Documentos ordenados por similitud, con 'similarity' (coseno
+            con la consulta) y 'embedding'
+        top_k: Número de documentos a seleccionar
+        lambda_mult: Peso de la relevancia frente a la diversidad (0-1)
+        
+    Returns:
+        Los documentos seleccionados, en orden de selección
+    """
+    if len(documents) <= top_k:
+        return documents
+    
+    vectors = [_normalize(doc['embedding']) for doc in documents]
+    # Máxima similitud de cada candidato con los ya seleccionados
+    max_redundancy: List[Optional[float]] = [None] * len(documents)
+    
+    selected: List[int] = []
+    remaining = list(range(len(documents)))
+    
+    while remaining and len(selected) < top_k:
+        if selected:
+            # Solo se calcula la similitud con el último elegido; el resto
+            # ya está acumulado en max_redundancy
+            last = vectors[selected[-1]]
+            for i in remaining:
+                sim = sum(map(mul, vectors[i], last))
+                if max_redundancy[i] is None or sim > max_redundancy[i]:
+                    max_redundancy[i] = sim
+        
+        best = max(
+            remaining,
+            key=lambda i: lambda_mult * documents[i]['similarity']
+            - (1 - lambda_mult) * (max_redundancy[i] or 0.0)
+        )
+        selected.append(best)
+        remaining.remove(best)
+    
+    return [documents[i] for i in selected]
@@ -0,0 +1,156 @@
+"""
+Caché semántico en memoria: reutiliza respuestas de consultas casi idénticas
+"""
+import json
+import math
+import time
+from collections import OrderedDict
+from operator import mul
+from typing import Optional, Dict, Any, List, Tuple
+
+
+class SemanticCache:
+    """
+    Caché de respuestas indexado por el embedding de la consulta
+    
+    A diferencia de SimpleCache (coincidencia exacta del texto), devuelve la
+    respuesta de una consulta anterior cuyo embedding tenga similitud coseno
+    mayor o igual al umbral, p.ej. "¿Qué es RAG?" y "¿qué es RAG exactamente?".
+    La búsqueda es lineal sobre las entradas vigentes (max_size pequeño).
+    """
+    
+    def __init__(self, max_size: int = 100, ttl_minutes: int = 30, threshold: float = 0.95):
+        """
+        Inicializa el caché
+        
+        Args:
+            max_size: Número máximo de elementos en caché
+            ttl_minutes: Tiempo de vida en minutos
+            threshold: Similitud coseno mínima para considerar un acierto (0-1)
+        """
+        # Clave interna -> (embedding normalizado, clave de parámetros, datos, timestamp)
+        self.cache: "OrderedDict[int, Tuple[List[float], str, Dict[str, Any], float]]" = OrderedDict()
+        self.max_size = max_size
+        self.ttl_seconds = ttl_minutes * 60.0
+        self.threshold = threshold
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _normalize(embedding: List[float]) -> List[float]:
+        """Normaliza el vector (norma 1) para que el producto punto sea el coseno"""
+        norm = math.sqrt(sum(map(mul, embedding, embedding)))
+        if norm == 0:
+            return list(embedding)
+        return [x / norm for x in embedding]
+    
+    def _find(self, vector: List[float], params_key: str) -> Tuple[Optional[int], float]:
+        """
+        Busca la entrada vigente más similar con los mismos parámetros
+        
+        Returns:
+            Tupla (clave de la entrada o None, similitud)
+        """
+        now = time.monotonic()
+        best_key, best_similarity = None, -1.0
+        expired = []
+        
+        for key, (cached_vector, cached_params, _, timestamp) in self.cache.items():
+            if now - timestamp >= self.ttl_seconds:
+                expired.append(key)
+                continue
+            if cached_params != params_key:
+                continue
+            similarity = sum(map(mul, vector, cached_vector))
+            if similarity > best_similarity:
+                best_key, best_similarity = key, similarity
+        
+        for key in expired:
+            del self.cache[key]
+        
+        return best_key, best_similarity
+    
+    @staticmethod
+    def _params_key(params: Optional[Dict[str, Any]]) -> str:
+        """Representación canónica de los parámetros de búsqueda"""
+        return json.dumps(params or {}, sort_keys=True)
+    
+    def get(self, embedding: List[float], params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene la respuesta de una consulta semánticamente equivalente
+        
+        Args:
+            embedding: Embedding de la consulta
+            params: Parámetros de búsqueda (filtros, top_k...); solo coinciden
+                entradas guardadas con los mismos parámetros
+            
+        Returns:
+            Resultado cacheado o None
+        """
+        key, similarity = self._find(self._normalize(embedding), self._params_key(params))
+        
+        if key is not None and similarity >= self.threshold:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key][2]
+        
+        self.misses += 1
+        return None
+    
+    def set(self, embedding: List[float], data: Dict[str, Any], params: Optional[Dict[str, Any]] = None):
+        """
+        Guarda un resultado en el caché
+        
+        Si ya existe una entrada casi idéntica (similitud >= umbral) se
+        reemplaza en lugar de añadir un duplicado.
+        
+        Args:
+            embedding: Embedding de la consulta
+            data: Datos a cachear
+            params: Parámetros de búsqueda
+        """
+        vector = self._normalize(embedding)
+        params_key = self._params_key(params)
+        key, similarity = self._find(vector, params_key)
+        
+        if key is not None and similarity >= self.threshold:
+            del self.cache[key]
+        elif len(self.cache) >= self.max_size:
+            # Eliminar el elemento menos recientemente usado
+            self.cache.popitem(last=False)
+        
+        self._next_id += 1
+        self.cache[self._next_id] = (vector, params_key, data, time.monotonic())
+    
+    def clear(self):
+        """Limpia todo el caché"""
+        self.cache.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtiene estadísticas del caché"""
+        return {
+            'size': len(self.cache),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'threshold': self.threshold,
+            'ttl_minutes': self.ttl_seconds / 60
+        }
+
+
+# Instancia global del caché (persistente durante la vida del contenedor Lambda)
+_semantic_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache(threshold: float = 0.95) -> SemanticCache:
+    """
+    Obtiene la instancia del caché semántico
+    
+    Args:
+        threshold: Similitud mínima para un acierto (solo se usa la primera vez)
+    """
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache(max_size=100, ttl_minutes=30, threshold=threshold)
+    return _semantic_cache
@@ -3,10 +3,21 @@ Configuración central del sistema RAG
 """
 import os
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 
+# Las secciones son inmutables (frozen) y con __slots__: se crean una vez por
+# contenedor y sus atributos se leen sin pasar por un __dict__ por instancia
 
-@dataclass
+# Variables de entorno, resueltas una sola vez al importar el módulo
+_RAW_BUCKET_NAME = os.getenv("RAW_BUCKET_NAME", "rag-system-raw-docs")
+_PROCESSED_BUCKET_NAME = os.getenv("PROCESSED_BUCKET_NAME", "rag-system-processed")
+_OPENSEARCH_ENDPOINT = os.getenv("OPENSEARCH_ENDPOINT")
+_OPENSEARCH_USERNAME = os.getenv("OPENSEARCH_USERNAME", "admin")
+_OPENSEARCH_PASSWORD = os.getenv("OPENSEARCH_PASSWORD")
+
+
+@dataclass(frozen=True, slots=True)
 class BedrockConfig:
     """Configuración para Amazon Bedrock"""
     # Modelo de embeddings
@@ -22,7 +33,7 @@ class BedrockConfig:
     region_name: str = "us-east-1"
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ChunkingConfig:
     """Configuración para división de documentos"""
     chunk_size: int = 800
@@ -30,7 +41,7 @@ class ChunkingConfig:
     separator: str = "\n\n"
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class RetrievalConfig:
     """Configuración para búsqueda vectorial"""
     top_k: int = 5
@@ -38,24 +49,26 @@ class RetrievalConfig:
     similarity_metric: str = "cosine"
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class S3Config:
     """Configuración para S3"""
-    raw_bucket_name: str = os.getenv("RAW_BUCKET_NAME", "rag-system-raw-docs")
-    processed_bucket_name: str = os.getenv("PROCESSED_BUCKET_NAME", "rag-system-processed")
+    raw_bucket_name: str = _RAW_BUCKET_NAME
+    processed_bucket_name: str = _PROCESSED_BUCKET_NAME
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class OpenSearchConfig:
     """Configuración para OpenSearch"""
-    endpoint: Optional[str] = os.getenv("OPENSEARCH_ENDPOINT")
+    endpoint: Optional[str] = _OPENSEARCH_ENDPOINT
     index_name: str = "rag-documents"
-    username: Optional[str] = os.getenv("OPENSEARCH_USERNAME", "admin")
-    password: Optional[str] = os.getenv("OPENSEARCH_PASSWORD")
+    username: Optional[str] = _OPENSEARCH_USERNAME
+    password: Optional[str] = _OPENSEARCH_PASSWORD
 
 
 class Config:
     """Configuración principal del sistema"""
+    __slots__ = ("bedrock", "chunking", "retrieval", "s3", "opensearch")
+    
     def __init__(self):
         self.bedrock = BedrockConfig()
         self.chunking = ChunkingConfig()
@@ -64,5 +77,11 @@ class Config:
         self.opensearch = OpenSearchConfig()
 
 
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Obtiene la configuración del sistema (se construye una sola vez por contenedor)"""
+    return Config()
+
+
 # Instancia global de configuración
-config = Config()
+config = get_config()
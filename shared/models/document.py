@@ -1,11 +1,31 @@
 """
 Modelos de datos para documentos y chunks
 """
+import json
 from dataclasses import dataclass, field
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 from enum import Enum
 
+# orjson (opcional) serializa dataclasses, Enums y datetimes directamente,
+# sin el diccionario intermedio de to_dict()
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _serialize(obj: Any) -> bytes:
+    """
+    Serializa un modelo a JSON
+    
+    Con orjson el dataclass se recorre en C (Enums como su valor y datetimes en
+    ISO 8601); sin orjson se usa to_dict() con json
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj.to_dict(), ensure_ascii=False).encode('utf-8')
+
 
 class DocumentStatus(Enum):
     """Estados posibles de un documento"""
@@ -25,7 +45,7 @@ class DocumentType(Enum):
     JSON = "json"
 
 
-@dataclass
+@dataclass(slots=True)
 class DocumentMetadata:
     """Metadatos de un documento"""
     document_id: str
@@ -39,9 +59,25 @@ class DocumentMetadata:
     language: str = "es"
     tags: List[str] = field(default_factory=list)
     custom_metadata: Dict[str, Any] = field(default_factory=dict)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convierte los metadatos a diccionario serializable"""
+        return {
+            "document_id": self.document_id,
+            "title": self.title,
+            "source": self.source,
+            "document_type": self.document_type.value,
+            "author": self.author,
+            "created_at": self.created_at.isoformat(),
+            "file_size": self.file_size,
+            "page_count": self.page_count,
+            "language": self.language,
+            "tags": self.tags,
+            "custom_metadata": self.custom_metadata
+        }
 
 
-@dataclass
+@dataclass(slots=True)
 class DocumentChunk:
     """Fragmento de un documento con su embedding"""
     chunk_id: str
@@ -63,11 +99,15 @@ class DocumentChunk:
             "chunk_index": self.chunk_index,
             "start_char": self.start_char,
             "end_char": self.end_char,
-            "metadata": self.metadata.__dict__ if self.metadata else None
+            "metadata": self.metadata.to_dict() if self.metadata else None
         }
+    
+    def serialize(self) -> bytes:
+        """Serializa el chunk a JSON (mismo contenido que to_dict)"""
+        return _serialize(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Document:
     """Documento completo"""
     document_id: str
@@ -83,15 +123,19 @@ class Document:
         return {
             "document_id": self.document_id,
             "content": self.content,
-            "metadata": self.metadata.__dict__,
+            "metadata": self.metadata.to_dict(),
             "chunks": [chunk.to_dict() for chunk in self.chunks],
             "status": self.status.value,
             "error_message": self.error_message,
             "processed_at": self.processed_at.isoformat() if self.processed_at else None
         }
+    
+    def serialize(self) -> bytes:
+        """Serializa el documento a JSON (mismo contenido que to_dict)"""
+        return _serialize(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class QueryResult:
     """Resultado de una búsqueda"""
     query: str
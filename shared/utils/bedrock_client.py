@@ -1,50 +1,249 @@
 """
 Cliente para Amazon Bedrock - Embeddings y LLM
 """
+import asyncio
+import hashlib
 import json
-import boto3
-from typing import List, Dict, Any, Optional
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterator, Optional
 from botocore.exceptions import ClientError
 
+# orjson (opcional) serializa y parsea los cuerpos de InvokeModel bastante más
+# rápido que json y retiene menos el GIL con el pool de embeddings; boto3
+# acepta el cuerpo como bytes
+try:
+    import orjson
+    
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+    
+    _loads = json.loads
+
+# Hilos para las variantes async (boto3 no tiene API asíncrona nativa)
+ASYNC_MAX_WORKERS = 32
+
+# Embeddings recordados por contenedor (array de float64: ~8 KB por vector de 1024)
+EMBEDDING_CACHE_SIZE = 2048
+
+# Máximo de textos por llamada a Cohere Embed
+COHERE_MAX_TEXTS_PER_CALL = 96
+
+# Pool HTTP del cliente de bedrock-runtime: cubre las llamadas concurrentes de
+# generate_embeddings_batch y del pool async sin reabrir conexiones TLS
+BEDROCK_MAX_POOL_CONNECTIONS = 64
+
+
+def _is_cohere_embedding_model(model_id: str) -> bool:
+    """Cohere Embed acepta varios textos por llamada (Titan solo uno)"""
+    return model_id.startswith("cohere.embed")
+
+
+def _claude_request_body(
+    prompt: str,
+    system_prompt: Optional[str],
+    temperature: float,
+    max_tokens: int,
+    cache_system_prompt: bool
+) -> Dict[str, Any]:
+    """Cuerpo de InvokeModel para Claude (API de mensajes de Anthropic)"""
+    # Construir mensajes
+    messages = [
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+    
+    # Preparar el cuerpo de la solicitud
+    body = {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+        "messages": messages,
+        "temperature": temperature
+    }
+    
+    # Añadir system prompt si existe
+    if system_prompt and cache_system_prompt:
+        body["system"] = [{
+            "type": "text",
+            "text": system_prompt,
+            "cache_control": {"type": "ephemeral"}
+        }]
+    elif system_prompt:
+        body["system"] = system_prompt
+    
+    return body
+
 
 class BedrockClient:
     """Cliente para interactuar con Amazon Bedrock"""
     
-    def __init__(self, region_name: str = "us-east-1"):
+    __slots__ = (
+        'bedrock_runtime', 'region_name', '_executor',
+        '_embedding_cache', '_embedding_cache_size', '_embedding_cache_lock',
+        '_embedding_cache_hits', '_embedding_cache_misses'
+    )
+    
+    def __init__(
+        self,
+        region_name: str = "us-east-1",
+        embedding_cache_size: int = EMBEDDING_CACHE_SIZE
+    ):
         """
         Inicializa el cliente de Bedrock
         
         Args:
             region_name: Región de AWS donde está habilitado Bedrock
+            embedding_cache_size: Máximo de embeddings en el caché LRU
+                (0 lo desactiva)
         """
+        # boto3 se importa al crear el cliente: importar este módulo (p.ej. solo
+        # por sus constantes) no paga su costo de carga en el cold start
+        import boto3
+        from botocore.config import Config
+        
         self.bedrock_runtime = boto3.client(
             service_name='bedrock-runtime',
-            region_name=region_name
+            region_name=region_name,
+            config=Config(
+                max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+                # Única capa de reintentos: el modo adaptativo reintenta
+                # ThrottlingException con backoff y jitter y además limita la
+                # tasa del lado del cliente, en lugar de reintentar todos a la vez
+                retries={"mode": "adaptive", "max_attempts": 5},
+                tcp_keepalive=True,
+                connect_timeout=3,
+                read_timeout=60
+            )
         )
         self.region_name = region_name
+        # Pool para las variantes async; los hilos se crean bajo demanda
+        self._executor = ThreadPoolExecutor(max_workers=ASYNC_MAX_WORKERS)
+        # Caché LRU de embeddings: los modelos son deterministas para un mismo
+        # texto, así que chunks repetidos o consultas populares no vuelven a
+        # Bedrock. El lock lo protege del pool de generate_embeddings_batch
+        self._embedding_cache: OrderedDict = OrderedDict()
+        self._embedding_cache_size = embedding_cache_size
+        self._embedding_cache_lock = threading.Lock()
+        self._embedding_cache_hits = 0
+        self._embedding_cache_misses = 0
         
     def generate_embeddings(
         self, 
         text: str, 
-        model_id: str = "amazon.titan-embed-text-v2:0"
+        model_id: str = "amazon.titan-embed-text-v2:0",
+        input_type: str = "search_document"
     ) -> List[float]:
         """
-        Genera embeddings para un texto usando Titan Embeddings
+        Genera embeddings para un texto usando Titan Embeddings (o Cohere Embed)
         
         Args:
             text: Texto a convertir en embedding
             model_id: ID del modelo de embeddings
+            input_type: Tipo de entrada para Cohere ('search_document' al indexar,
+                'search_query' al consultar); Titan lo ignora
             
         Returns:
             Lista de floats representando el vector de embedding
         """
+        if self._embedding_cache_size <= 0:
+            return self._invoke_embeddings([text], model_id, input_type)[0]
+        
+        key = hashlib.blake2b(
+            f"{model_id}\x00{input_type}\x00{text}".encode('utf-8'),
+            digest_size=16
+        ).digest()
+        with self._embedding_cache_lock:
+            cached = self._embedding_cache.get(key)
+            if cached is not None:
+                self._embedding_cache.move_to_end(key)
+                self._embedding_cache_hits += 1
+                return cached.tolist()
+            self._embedding_cache_misses += 1
+        
+        embedding = self._invoke_embeddings([text], model_id, input_type)[0]
+        with self._embedding_cache_lock:
+            self._embedding_cache[key] = array('d', embedding)
+            self._embedding_cache.move_to_end(key)
+            if len(self._embedding_cache) > self._embedding_cache_size:
+                self._embedding_cache.popitem(last=False)
+        return embedding
+    
+    def get_embedding_cache_stats(self) -> Dict[str, Any]:
+        """Estadísticas del caché de embeddings"""
+        with self._embedding_cache_lock:
+            total = self._embedding_cache_hits + self._embedding_cache_misses
+            return {
+                'size': len(self._embedding_cache),
+                'max_size': self._embedding_cache_size,
+                'hits': self._embedding_cache_hits,
+                'misses': self._embedding_cache_misses,
+                'hit_rate': self._embedding_cache_hits / total if total else 0.0
+            }
+    
+    def generate_query_embeddings(
+        self,
+        texts: List[str],
+        model_id: str = "amazon.titan-embed-text-v2:0"
+    ) -> List[List[float]]:
+        """
+        Genera los embeddings de varias consultas (p.ej. la pregunta actual y el
+        último turno de una conversación)
+        
+        Con Cohere Embed todas las consultas van en una sola llamada a
+        InvokeModel; Titan solo acepta un texto por llamada.
+        
+        Args:
+            texts: Textos de las consultas
+            model_id: ID del modelo de embeddings
+            
+        Returns:
+            Lista de vectores de embeddings, en el mismo orden
+        """
+        if _is_cohere_embedding_model(model_id):
+            return self._invoke_embeddings(texts, model_id, "search_query")
+        return [
+            self.generate_embeddings(text, model_id, "search_query")
+            for text in texts
+        ]
+    
+    def _invoke_embeddings(
+        self,
+        texts: List[str],
+        model_id: str,
+        input_type: str
+    ) -> List[List[float]]:
+        """
+        Invoca el modelo de embeddings una vez
+        
+        Args:
+            texts: Textos a convertir (Titan: exactamente uno; Cohere: hasta 96)
+            model_id: ID del modelo de embeddings
+            input_type: Tipo de entrada para Cohere
+            
+        Returns:
+            Un vector por texto
+        """
         try:
-            # Preparar el cuerpo de la solicitud
-            body = json.dumps({
-                "inputText": text
-            })
+            # Preparar el cuerpo de la solicitud según el proveedor
+            cohere = _is_cohere_embedding_model(model_id)
+            if cohere:
+                body = _dumps({
+                    "texts": texts,
+                    "input_type": input_type
+                })
+            else:
+                body = _dumps({
+                    "inputText": texts[0]
+                })
             
-            # Invocar el modelo
+            # Invocar el modelo (botocore reintenta si Bedrock limita la tasa)
             response = self.bedrock_runtime.invoke_model(
                 modelId=model_id,
                 body=body,
@@ -53,10 +252,10 @@ class BedrockClient:
             )
             
             # Parsear respuesta
-            response_body = json.loads(response['body'].read())
-            embedding = response_body.get('embedding', [])
-            
-            return embedding
+            response_body = _loads(response['body'].read())
+            if cohere:
+                return response_body.get('embeddings', [])
+            return [response_body.get('embedding', [])]
             
         except ClientError as e:
             print(f"Error generando embeddings: {e}")
@@ -68,31 +267,90 @@ class BedrockClient:
     def generate_embeddings_batch(
         self, 
         texts: List[str], 
-        model_id: str = "amazon.titan-embed-text-v2:0"
+        model_id: str = "amazon.titan-embed-text-v2:0",
+        max_concurrency: int = 16
     ) -> List[List[float]]:
         """
         Genera embeddings para múltiples textos
         
+        Las llamadas a Bedrock se reparten en un pool de hilos (el cliente de
+        boto3 es thread-safe) y cada resultado se guarda en su posición original.
+        Los textos más largos (los más lentos) se envían primero para que los
+        cortos rellenen los huecos y no quede un rezagado al final.
+        Con Cohere Embed cada llamada lleva hasta 96 textos y lo que se
+        reparte en el pool son esos lotes
+        
         Args:
             texts: Lista de textos
             model_id: ID del modelo de embeddings
+            max_concurrency: Máximo de llamadas simultáneas a Bedrock
             
         Returns:
-            Lista de vectores de embeddings
+            Lista de vectores de embeddings, en el mismo orden que texts
         """
-        embeddings = []
-        for text in texts:
-            embedding = self.generate_embeddings(text, model_id)
-            embeddings.append(embedding)
+        if _is_cohere_embedding_model(model_id):
+            return self._generate_cohere_embeddings_batch(texts, model_id, max_concurrency)
+        
+        if len(texts) <= 1 or max_concurrency <= 1:
+            return [self.generate_embeddings(text, model_id) for text in texts]
+        
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(texts))) as executor:
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+            futures = {
+                executor.submit(self.generate_embeddings, texts[i], model_id): i
+                for i in order
+            }
+            try:
+                for future in as_completed(futures):
+                    embeddings[futures[future]] = future.result()
+            except Exception:
+                # Un embedding fallido cancela los pendientes y se propaga
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
         return embeddings
     
+    def _generate_cohere_embeddings_batch(
+        self,
+        texts: List[str],
+        model_id: str,
+        max_concurrency: int
+    ) -> List[List[float]]:
+        """
+        Embeddings de documentos con Cohere: una llamada por cada 96 textos
+        
+        Args:
+            texts: Lista de textos
+            model_id: ID del modelo Cohere Embed
+            max_concurrency: Máximo de llamadas simultáneas a Bedrock
+            
+        Returns:
+            Lista de vectores de embeddings, en el mismo orden que texts
+        """
+        batches = [
+            texts[i:i + COHERE_MAX_TEXTS_PER_CALL]
+            for i in range(0, len(texts), COHERE_MAX_TEXTS_PER_CALL)
+        ]
+        
+        def embed(batch: List[str]) -> List[List[float]]:
+            return self._invoke_embeddings(batch, model_id, "search_document")
+        
+        if len(batches) <= 1 or max_concurrency <= 1:
+            results = [embed(batch) for batch in batches]
+        else:
+            # executor.map conserva el orden de los lotes
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batches))) as executor:
+                results = list(executor.map(embed, batches))
+        return [embedding for batch in results for embedding in batch]
+    
     def generate_response(
         self,
         prompt: str,
         system_prompt: Optional[str] = None,
         model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0",
         temperature: float = 0.2,
-        max_tokens: int = 2048
+        max_tokens: int = 2048,
+        cache_system_prompt: bool = False
     ) -> str:
         """
         Genera una respuesta usando Claude (para el Lambda de Query)
@@ -103,41 +361,27 @@ class BedrockClient:
             model_id: ID del modelo LLM
             temperature: Control de aleatoriedad (0-1)
             max_tokens: Máximo de tokens en la respuesta
+            cache_system_prompt: Marcar el system prompt con cache_control para
+                el caché de prompts de Bedrock (solo modelos que lo soportan)
             
         Returns:
             Respuesta generada por el modelo
         """
         try:
-            # Construir mensajes
-            messages = [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
-            
-            # Preparar el cuerpo de la solicitud
-            body = {
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": max_tokens,
-                "messages": messages,
-                "temperature": temperature
-            }
-            
-            # Añadir system prompt si existe
-            if system_prompt:
-                body["system"] = system_prompt
+            body = _claude_request_body(
+                prompt, system_prompt, temperature, max_tokens, cache_system_prompt
+            )
             
             # Invocar el modelo
             response = self.bedrock_runtime.invoke_model(
                 modelId=model_id,
-                body=json.dumps(body),
+                body=_dumps(body),
                 contentType='application/json',
                 accept='application/json'
             )
             
             # Parsear respuesta
-            response_body = json.loads(response['body'].read())
+            response_body = _loads(response['body'].read())
             
             # Extraer el texto de la respuesta
             content = response_body.get('content', [])
@@ -152,6 +396,131 @@ class BedrockClient:
         except Exception as e:
             print(f"Error inesperado: {e}")
             raise
+    
+    def stream_response(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0",
+        temperature: float = 0.2,
+        max_tokens: int = 2048,
+        cache_system_prompt: bool = False
+    ) -> Iterator[str]:
+        """
+        Genera una respuesta con Claude entregando el texto a medida que llega
+        
+        Usa invoke_model_with_response_stream: el primer fragmento llega tras
+        el primer token en lugar de esperar a la respuesta completa (útil con
+        Lambda response streaming o WebSockets). Mismos argumentos que
+        generate_response; "".join(stream_response(...)) da el mismo texto.
+        
+        Yields:
+            Fragmentos de texto de la respuesta, en orden
+        """
+        try:
+            body = _claude_request_body(
+                prompt, system_prompt, temperature, max_tokens, cache_system_prompt
+            )
+            
+            response = self.bedrock_runtime.invoke_model_with_response_stream(
+                modelId=model_id,
+                body=_dumps(body),
+                contentType='application/json',
+                accept='application/json'
+            )
+            
+            # Cada evento trae un mensaje de la API de Claude; el texto llega
+            # en los content_block_delta
+            for event in response['body']:
+                chunk = event.get('chunk')
+                if not chunk:
+                    continue
+                message = _loads(chunk['bytes'])
+                if message.get('type') == 'content_block_delta':
+                    text = message.get('delta', {}).get('text')
+                    if text:
+                        yield text
+            
+        except ClientError as e:
+            print(f"Error generando respuesta en streaming: {e}")
+            raise
+        except Exception as e:
+            print(f"Error inesperado: {e}")
+            raise
+
+    
+    async def agenerate_embeddings(
+        self,
+        text: str,
+        model_id: str = "amazon.titan-embed-text-v2:0",
+        input_type: str = "search_document"
+    ) -> List[float]:
+        """
+        Variante async de generate_embeddings (no bloquea el event loop)
+        
+        Args:
+            text: Texto a convertir en embedding
+            model_id: ID del modelo de embeddings
+            input_type: Tipo de entrada para Cohere
+            
+        Returns:
+            Lista de floats representando el vector de embedding
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.generate_embeddings, text, model_id, input_type
+        )
+    
+    async def agenerate_embeddings_batch(
+        self,
+        texts: List[str],
+        model_id: str = "amazon.titan-embed-text-v2:0",
+        max_concurrency: int = 16
+    ) -> List[List[float]]:
+        """
+        Variante async de generate_embeddings_batch con asyncio.gather
+        
+        Args:
+            texts: Lista de textos
+            model_id: ID del modelo de embeddings
+            max_concurrency: Máximo de llamadas simultáneas a Bedrock
+            
+        Returns:
+            Lista de vectores de embeddings, en el mismo orden que texts
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def embed(text: str) -> List[float]:
+            async with semaphore:
+                return await self.agenerate_embeddings(text, model_id)
+        
+        return await asyncio.gather(*(embed(text) for text in texts))
+    
+    async def agenerate_response(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0",
+        temperature: float = 0.2,
+        max_tokens: int = 2048,
+        cache_system_prompt: bool = False
+    ) -> str:
+        """
+        Variante async de generate_response (mismos argumentos)
+        
+        Returns:
+            Respuesta generada por el modelo
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor,
+            lambda: self.generate_response(
+                prompt,
+                system_prompt,
+                model_id=model_id,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                cache_system_prompt=cache_system_prompt
+            )
+        )
 
 
 # Instancia global para reutilización en Lambda
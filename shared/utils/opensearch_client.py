@@ -2,14 +2,29 @@
 Cliente para OpenSearch - Indexación y búsqueda vectorial
 """
 import json
-from typing import List, Dict, Any, Optional
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
-import boto3
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+
+# Motores k-NN que aceptan filtros dentro de la query (knn.filter)
+EFFICIENT_FILTER_ENGINES = ("lucene", "faiss")
+
+# Motor de los índices creados antes del cambio a lucene (y el que asume el
+# plugin k-NN si el mapping no lo indica)
+LEGACY_ENGINE = "nmslib"
+
+# min_score se compara con la similitud coseno, no con el _score del motor
+# (lucene puntúa (1 + cos) / 2; nmslib y faiss 1 / (2 - cos)). 0.57 equivale
+# al antiguo min_score de 0.7 sobre el _score de nmslib
+DEFAULT_MIN_SIMILARITY = 0.57
 
 
 class OpenSearchClient:
     """Cliente para interactuar con Amazon OpenSearch Service"""
     
+    __slots__ = (
+        'endpoint', 'region', 'index_name', 'client', '_async_client',
+        '_engine'
+    )
+    
     def __init__(
         self, 
         endpoint: str,
@@ -27,6 +42,13 @@ class OpenSearchClient:
         self.endpoint = endpoint
         self.region = region
         self.index_name = index_name
+        # Cliente async (aiohttp), creado al primer uso de aindex_documents_batch
+        self._async_client = None
+        
+        # opensearchpy y boto3 se importan al crear el cliente, no al importar
+        # el módulo (menos cold start para quien solo usa PostgreSQL)
+        import boto3
+        from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
         
         # Autenticación con IAM
         credentials = boto3.Session().get_credentials()
@@ -41,20 +63,26 @@ class OpenSearchClient:
             connection_class=RequestsHttpConnection
         )
         
-        # Crear índice si no existe
-        self._create_index_if_not_exists()
+        # Crear índice si no existe; el motor decide filtros y escala de scores
+        self._engine = self._create_index_if_not_exists()
     
-    def _create_index_if_not_exists(self):
-        """Crea el índice con configuración k-NN si no existe"""
+    def _create_index_if_not_exists(self) -> str:
+        """
+        Crea el índice con configuración k-NN si no existe
+        
+        Returns:
+            Motor k-NN del campo embedding del índice
+        """
         if self.client.indices.exists(index=self.index_name):
-            return
+            return self._index_engine()
         
-        # Configuración del índice con soporte k-NN
+        # Configuración del índice con soporte k-NN. El motor lucene aplica los
+        # filtros de metadatos durante el recorrido del grafo HNSW (nmslib solo
+        # puede filtrar después); su ef_search es el k de cada consulta
         index_body = {
             "settings": {
                 "index": {
-                    "knn": True,
-                    "knn.algo_param.ef_search": 512
+                    "knn": True
                 }
             },
             "mappings": {
@@ -65,7 +93,7 @@ class OpenSearchClient:
                         "method": {
                             "name": "hnsw",
                             "space_type": "cosinesimil",
-                            "engine": "nmslib",
+                            "engine": "lucene",
                             "parameters": {
                                 "ef_construction": 512,
                                 "m": 16
@@ -76,13 +104,46 @@ class OpenSearchClient:
                     "document_id": {"type": "keyword"},
                     "chunk_id": {"type": "keyword"},
                     "chunk_index": {"type": "integer"},
-                    "metadata": {"type": "object", "enabled": True}
+                    # flat_object guarda la metadata sin mapear cada clave como
+                    # campo propio: no crece el mapping con claves nuevas y sigue
+                    # admitiendo filtros term sobre "metadata.<clave>"
+                    "metadata": {"type": "flat_object"}
                 }
             }
         }
         
         self.client.indices.create(index=self.index_name, body=index_body)
         print(f"Índice '{self.index_name}' creado exitosamente")
+        return "lucene"
+    
+    def _index_engine(self) -> str:
+        """
+        Lee el motor del campo embedding de un índice ya existente
+        
+        Returns:
+            Motor k-NN; nmslib para índices creados antes del cambio de motor
+            (rechaza knn.filter) o si no se puede leer el mapping
+        """
+        try:
+            mapping = self.client.indices.get_mapping(index=self.index_name)
+            properties = next(iter(mapping.values()))["mappings"]["properties"]
+            engine = properties["embedding"].get("method", {}).get("engine", LEGACY_ENGINE)
+        except Exception as e:
+            print(f"No se pudo leer el motor k-NN del índice, se asume {LEGACY_ENGINE}: {e}")
+            return LEGACY_ENGINE
+        
+        if engine not in EFFICIENT_FILTER_ENGINES:
+            print(
+                f"Índice '{self.index_name}' con motor {engine}: los filtros se "
+                "aplican después del k-NN (recrear el índice para usar lucene)"
+            )
+        return engine
+    
+    def _to_cosine(self, score: float) -> float:
+        """Convierte el _score k-NN (cosinesimil) del motor del índice a coseno"""
+        if self._engine == "lucene":
+            return 2 * score - 1
+        return 2 - 1 / score
     
     def index_document(
         self, 
@@ -91,7 +152,9 @@ class OpenSearchClient:
         content: str,
         embedding: List[float],
         chunk_index: int = 0,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        routing: Optional[str] = None,
+        refresh: bool = False
     ) -> bool:
         """
         Indexa un chunk de documento en OpenSearch
@@ -103,6 +166,10 @@ class OpenSearchClient:
             embedding: Vector de embedding
             chunk_index: Posición del chunk en el documento
             metadata: Metadatos adicionales
+            routing: Clave de routing (p.ej. tenant_id) para ubicar el chunk en un solo shard
+            refresh: Refrescar el índice para que el chunk sea visible de inmediato
+                (fuerza un segmento nuevo por llamada; usar refresh_index() al
+                terminar una ingesta en su lugar)
             
         Returns:
             True si la indexación fue exitosa
@@ -121,7 +188,8 @@ class OpenSearchClient:
                 index=self.index_name,
                 id=chunk_id,
                 body=document,
-                refresh=True
+                refresh=refresh,
+                routing=routing
             )
             
             return response['result'] in ['created', 'updated']
@@ -132,41 +200,140 @@ class OpenSearchClient:
     
     def index_documents_batch(
         self, 
-        documents: List[Dict[str, Any]]
+        documents: List[Dict[str, Any]],
+        routing: Optional[str] = None
     ) -> Dict[str, int]:
         """
         Indexa múltiples documentos en batch
         
         Args:
             documents: Lista de diccionarios con los datos a indexar
+            routing: Clave de routing común a todos los documentos (opcional)
             
         Returns:
             Diccionario con estadísticas de la operación
         """
-        from opensearchpy.helpers import bulk
+        from opensearchpy.helpers import streaming_bulk
         
-        actions = []
+        success = 0
+        failed = 0
+        try:
+            # Las acciones se generan a medida que se envía cada bloque de 500:
+            # solo un bloque vive en memoria a la vez
+            for ok, _ in streaming_bulk(
+                self.client,
+                self._bulk_actions(documents, routing),
+                chunk_size=500,
+                max_chunk_bytes=100 * 1024 * 1024,
+                max_retries=3,
+                initial_backoff=2,
+                raise_on_error=False,
+                refresh=False
+            ):
+                if ok:
+                    success += 1
+                else:
+                    failed += 1
+            return {"success": success, "failed": failed}
+        except Exception as e:
+            print(f"Error en indexación batch: {e}")
+            return {"success": success, "failed": len(documents) - success}
+    
+    def _bulk_actions(
+        self,
+        documents: Iterable[Dict[str, Any]],
+        routing: Optional[str]
+    ) -> Iterator[Dict[str, Any]]:
+        """Genera las acciones de bulk para indexar los documentos (con routing opcional)"""
         for doc in documents:
             action = {
                 "_index": self.index_name,
                 "_id": doc.get("chunk_id"),
                 "_source": doc
             }
-            actions.append(action)
+            if routing is not None:
+                action["_routing"] = routing
+            yield action
+    
+    async def aindex_documents_batch(
+        self,
+        documents: List[Dict[str, Any]],
+        routing: Optional[str] = None
+    ) -> Dict[str, int]:
+        """
+        Variante async de index_documents_batch (AsyncOpenSearch + async_bulk)
+        
+        Permite solapar la indexación con la generación de embeddings en el
+        mismo event loop (p.ej. con BedrockClient.agenerate_embeddings_batch).
+        La sesión aiohttp queda ligada al event loop: llamar a aclose() antes
+        de que termine (p.ej. al final de cada asyncio.run)
+        
+        Args:
+            documents: Lista de diccionarios con los datos a indexar
+            routing: Clave de routing común a todos los documentos (opcional)
+            
+        Returns:
+            Diccionario con estadísticas de la operación
+        """
+        from opensearchpy.helpers import async_bulk
         
         try:
-            success, failed = bulk(self.client, actions)
+            # stats_only + raise_on_error=False: cuenta los fallos como el
+            # camino síncrono en vez de abortar con BulkIndexError al primero
+            success, failed = await async_bulk(
+                self._get_async_client(),
+                self._bulk_actions(documents, routing),
+                stats_only=True,
+                chunk_size=500,
+                max_chunk_bytes=100 * 1024 * 1024,
+                max_retries=3,
+                initial_backoff=2,
+                raise_on_error=False,
+                refresh=False
+            )
             return {"success": success, "failed": failed}
         except Exception as e:
-            print(f"Error en indexación batch: {e}")
+            print(f"Error en indexación batch async: {e}")
             return {"success": 0, "failed": len(documents)}
     
+    def _get_async_client(self):
+        """Crea (una vez) el cliente AsyncOpenSearch; requiere opensearch-py[async]"""
+        if self._async_client is None:
+            import boto3
+            from opensearchpy import AsyncOpenSearch, AIOHttpConnection, AWSV4SignerAsyncAuth
+            
+            credentials = boto3.Session().get_credentials()
+            self._async_client = AsyncOpenSearch(
+                hosts=[{'host': self.endpoint, 'port': 443}],
+                http_auth=AWSV4SignerAsyncAuth(credentials, self.region),
+                use_ssl=True,
+                verify_certs=True,
+                connection_class=AIOHttpConnection
+            )
+        return self._async_client
+    
+    async def aclose(self):
+        """Cierra la sesión aiohttp del cliente async, si se creó"""
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+    
+    def refresh_index(self):
+        """
+        Hace visibles para la búsqueda los documentos indexados hasta ahora
+        
+        Útil al terminar una ingesta cuando se necesita leer lo escrito sin
+        esperar al refresh periódico del índice
+        """
+        self.client.indices.refresh(index=self.index_name)
+    
     def search_similar(
         self, 
         query_embedding: List[float],
         k: int = 5,
-        min_score: float = 0.7,
-        filters: Optional[Dict[str, Any]] = None
+        min_score: float = DEFAULT_MIN_SIMILARITY,
+        filters: Optional[Dict[str, Any]] = None,
+        routing: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
         Busca documentos similares usando k-NN
@@ -174,71 +341,153 @@ class OpenSearchClient:
         Args:
             query_embedding: Vector de embedding de la consulta
             k: Número de resultados a retornar
-            min_score: Score mínimo de similitud
+            min_score: Similitud coseno mínima (independiente del motor)
             filters: Filtros adicionales de metadatos
+            routing: Clave de routing usada al indexar; limita la búsqueda a un
+                solo shard en lugar de consultar todos
             
         Returns:
-            Lista de documentos similares con sus scores
+            Lista de documentos similares con su similitud coseno como score
         """
         try:
-            # Query k-NN
-            query_body = {
-                "size": k,
-                "query": {
-                    "knn": {
-                        "embedding": {
-                            "vector": query_embedding,
-                            "k": k
-                        }
-                    }
-                }
-            }
+            query_body = self._build_knn_query(query_embedding, k, filters)
             
-            # Añadir filtros si existen
-            if filters:
-                query_body["query"] = {
-                    "bool": {
-                        "must": [
-                            query_body["query"]
-                        ],
-                        "filter": [
-                            {"term": {key: value}} 
-                            for key, value in filters.items()
-                        ]
-                    }
-                }
+            # Con routing solo se consulta el shard de esa clave, y preference
+            # fija la misma copia del shard para aprovechar sus cachés
+            search_params = {}
+            if routing is not None:
+                search_params = {"routing": routing, "preference": routing}
             
             response = self.client.search(
                 index=self.index_name,
-                body=query_body
+                body=query_body,
+                **search_params
             )
             
-            # Procesar resultados
-            results = []
-            for hit in response['hits']['hits']:
-                score = hit['_score']
-                if score >= min_score:
-                    results.append({
-                        "chunk_id": hit['_id'],
-                        "document_id": hit['_source'].get('document_id'),
-                        "content": hit['_source'].get('content'),
-                        "score": score,
-                        "chunk_index": hit['_source'].get('chunk_index'),
-                        "metadata": hit['_source'].get('metadata', {})
-                    })
-            
-            return results
+            return self._parse_hits(response['hits']['hits'], min_score)
             
         except Exception as e:
             print(f"Error en búsqueda: {e}")
             return []
     
-    def delete_document(self, document_id: str) -> int:
+    def search_similar_batch(
+        self,
+        query_embeddings: List[List[float]],
+        k: int = 5,
+        min_score: float = DEFAULT_MIN_SIMILARITY,
+        filters: Optional[Dict[str, Any]] = None,
+        routing: Optional[str] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Ejecuta varias búsquedas k-NN en una sola petición _msearch
+        
+        Útil cuando se recupera contexto para variantes de una misma consulta
+        (p.ej. la original y una reformulada): una sola ida y vuelta en lugar
+        de una por embedding.
+        
+        Args:
+            query_embeddings: Vectores de embedding de cada consulta
+            k: Número de resultados por consulta
+            min_score: Similitud coseno mínima (independiente del motor)
+            filters: Filtros de metadatos comunes a todas las consultas
+            routing: Clave de routing usada al indexar (opcional)
+            
+        Returns:
+            Una lista de resultados por embedding, en el mismo orden
+        """
+        if not query_embeddings:
+            return []
+        
+        header = {"index": self.index_name}
+        if routing is not None:
+            header.update(routing=routing, preference=routing)
+        
+        body = []
+        for query_embedding in query_embeddings:
+            body.append(header)
+            body.append(self._build_knn_query(query_embedding, k, filters))
+        
+        try:
+            response = self.client.msearch(body=body)
+            
+            results = []
+            for item in response['responses']:
+                if 'error' in item:
+                    print(f"Error en búsqueda: {item['error']}")
+                    results.append([])
+                else:
+                    results.append(self._parse_hits(item['hits']['hits'], min_score))
+            return results
+            
+        except Exception as e:
+            print(f"Error en búsqueda batch: {e}")
+            return [[] for _ in query_embeddings]
+    
+    def _build_knn_query(
+        self,
+        query_embedding: List[float],
+        k: int,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Construye el cuerpo de una búsqueda k-NN con filtros opcionales"""
+        knn = {
+            "vector": query_embedding,
+            "k": k
+        }
+        
+        if not filters:
+            return {"size": k, "query": {"knn": {"embedding": knn}}}
+        
+        term_filters = [
+            {"term": {key: value}} 
+            for key, value in filters.items()
+        ]
+        
+        # Filtro dentro de la query k-NN (pre-filtrado eficiente de lucene y
+        # faiss): devuelve k resultados que cumplen el filtro, en lugar de
+        # filtrar después los k vecinos más cercanos
+        if self._engine in EFFICIENT_FILTER_ENGINES:
+            knn["filter"] = {"bool": {"filter": term_filters}}
+            return {"size": k, "query": {"knn": {"embedding": knn}}}
+        
+        # nmslib no admite knn.filter: post-filtrado con bool
+        return {
+            "size": k,
+            "query": {
+                "bool": {
+                    "must": [{"knn": {"embedding": knn}}],
+                    "filter": term_filters
+                }
+            }
+        }
+    
+    def _parse_hits(self, hits: List[Dict[str, Any]], min_score: float) -> List[Dict[str, Any]]:
+        """
+        Convierte los hits de OpenSearch en resultados, descartando los de
+        similitud baja; el score es el coseno, igual con lucene o nmslib
+        """
+        results = []
+        for hit in hits:
+            score = self._to_cosine(hit['_score'])
+            if score >= min_score:
+                results.append({
+                    "chunk_id": hit['_id'],
+                    "document_id": hit['_source'].get('document_id'),
+                    "content": hit['_source'].get('content'),
+                    "score": score,
+                    "chunk_index": hit['_source'].get('chunk_index'),
+                    "metadata": hit['_source'].get('metadata', {})
+                })
+        
+        return results
+    
+    def delete_document(self, document_id: str, routing: Optional[str] = None) -> int:
         """
         Elimina todos los chunks de un documento
         
         Args:
             document_id: ID del documento a eliminar
+            routing: Clave de routing usada al indexar (opcional)
             
         Returns:
             Número de chunks eliminados
@@ -252,7 +501,8 @@ class OpenSearchClient:
             
             response = self.client.delete_by_query(
                 index=self.index_name,
-                body=query
+                body=query,
+                routing=routing
             )
             
             return response.get('deleted', 0)
@@ -1,22 +1,139 @@
 """
 Cliente para PostgreSQL con pgvector - Indexación y búsqueda vectorial
 """
+import io
 import json
 import os
-import boto3
-import psycopg2
-from psycopg2.extras import execute_values
-from typing import List, Dict, Any, Optional
+from array import array
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+
+# Escapes del formato de texto de COPY para contenido y metadata
+_COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r'
+})
+
+# ef_search mínimo del índice HNSW (el default de pgvector); se sube a
+# 4 * top_k para que el índice no devuelva menos candidatos que el LIMIT
+HNSW_EF_SEARCH_MIN = 40
+
+# Filas por sentencia INSERT en bulk_index_documents detrás de RDS Proxy
+# (execute_values usa 100 por defecto: un documento de 500 chunks serían 5
+# round trips)
+BULK_PAGE_SIZE = 500
+
+# Upsert de bulk_index_documents (filas desde VALUES o desde la tabla staging)
+_BULK_UPSERT_SQL = """
+    INSERT INTO documents (document_id, content, embedding, metadata)
+    {source}
+    ON CONFLICT (document_id) 
+    DO UPDATE SET 
+        content = EXCLUDED.content,
+        embedding = EXCLUDED.embedding,
+        metadata = EXCLUDED.metadata,
+        updated_at = CURRENT_TIMESTAMP;
+"""
+
+# Con filtros de metadatos el filtro se aplica sobre los candidatos del HNSW:
+# se amplía ef_search (hasta el máximo de pgvector) para que un filtro selectivo
+# no deje menos de top_k filas. En pgvector >= 0.8 además se activa el escaneo
+# iterativo, que sigue recorriendo el grafo hasta completar el LIMIT
+HNSW_EF_SEARCH_FILTERED = 400
+HNSW_EF_SEARCH_MAX = 1000
+
+# Búsqueda por similitud coseno: 1 - (embedding <=> query) da un score de 0 a 1.
+# El índice HNSW solo acelera ORDER BY embedding <=> query LIMIT k; el umbral
+# de similitud se aplica en Python sobre esas k filas para no condicionar el plan.
+# Los marcadores {vector}, {filters} y {limit} se sustituyen por $1..$3 (PREPARE)
+# o por parámetros con nombre de psycopg2; en el segundo caso el vector se envía
+# una sola vez en la CTE q y se referencia como q.v.
+# Los filtros de metadatos usan contención JSONB (metadata @> filtros).
+# {distance_column} es embedding o su conversión a halfvec (ver halfvec_index).
+_SEARCH_SQL = """
+    {query_cte}SELECT 
+        document_id,
+        content,
+        metadata,
+        1 - ({distance_column} <=> {vector}) as similarity{embedding_column}
+    FROM documents{query_table}
+    WHERE {filters} IS NULL OR metadata @> {filters}
+    ORDER BY {distance_column} <=> {vector}
+    LIMIT {limit}
+"""
+
+# Índice HNSW en media precisión (pgvector >= 0.7): la columna sigue siendo
+# vector(1024), pero el grafo indexa embedding::halfvec(1024), la mitad de
+# memoria por nodo. Las búsquedas deben usar la misma expresión para usarlo
+_HALFVEC_COLUMN = "embedding::halfvec(1024)"
+
+
+def _distance_operands(halfvec: bool) -> Tuple[str, str]:
+    """Expresión de la columna y tipo del vector de consulta para <=>"""
+    if halfvec:
+        return _HALFVEC_COLUMN, "halfvec(1024)"
+    return "embedding", "vector"
+
+
+def _search_sql(include_embeddings: bool, prepared: bool, halfvec: bool = False) -> str:
+    """SQL de search_similar para PREPARE ($n) o para ejecución directa (%(name)s)"""
+    embedding_column = ",\n        embedding::text" if include_embeddings else ""
+    distance_column, vector_type = _distance_operands(halfvec)
+    if prepared:
+        return _SEARCH_SQL.format(
+            query_cte="", query_table="",
+            vector=f"$1::{vector_type}" if halfvec else "$1",
+            filters="$2", limit="$3",
+            distance_column=distance_column,
+            embedding_column=embedding_column
+        )
+    # psycopg2 interpola los parámetros en el texto de la consulta: con la CTE
+    # el literal del vector (~10 KB) aparece una vez en lugar de tres
+    return _SEARCH_SQL.format(
+        query_cte=f"WITH q AS (SELECT %(vector)s::{vector_type} AS v)\n    ", query_table=", q",
+        vector="q.v", filters="%(filters)s::jsonb", limit="%(limit)s",
+        distance_column=distance_column,
+        embedding_column=embedding_column
+    )
+
+
+def _vector_literal(embedding: Sequence[float]) -> str:
+    """
+    Convierte un embedding (lista o array('f')) al literal de texto de pgvector
+    ('[x1,x2,...]')
+    
+    psycopg2 envía una lista de Python como ARRAY[...] de numeric (hasta 17
+    dígitos por valor) que el servidor luego convierte a vector. pgvector guarda
+    float32: se redondea cada valor a float32 y se escribe con 9 dígitos
+    significativos, que lo representan exactamente con un parámetro ~35% menor.
+    """
+    if not (isinstance(embedding, array) and embedding.typecode == 'f'):
+        embedding = array('f', embedding)
+    return '[' + ','.join([format(x, '.9g') for x in embedding]) + ']'
 
 
 class PostgresVectorClient:
     """Cliente para interactuar con PostgreSQL + pgvector"""
     
+    __slots__ = (
+        'db_name', 'region', 'connection', 'host', 'port', 'username',
+        'password', 'iam_auth', 'prepared_statements', 'halfvec_index', '_prepared',
+        '_iterative_scan'
+    )
+    
     def __init__(
         self, 
         db_secret_arn: str = None,
         db_name: str = "ragdb",
-        region: str = "us-east-1"
+        region: str = "us-east-1",
+        host: str = None,
+        port: int = 5432,
+        username: str = None,
+        iam_auth: bool = False,
+        prepared_statements: bool = True,
+        halfvec_index: bool = False
     ):
         """
         Inicializa el cliente de PostgreSQL
@@ -25,10 +142,32 @@ class PostgresVectorClient:
             db_secret_arn: ARN del secret con credenciales de DB
             db_name: Nombre de la base de datos
             region: Región de AWS
+            host: Endpoint de la DB o del RDS Proxy (si no se usa el secret)
+            port: Puerto de PostgreSQL
+            username: Usuario de la DB (si no se usa el secret)
+            iam_auth: Autenticarse con un token IAM en lugar de contraseña
+            prepared_statements: Preparar la búsqueda vectorial una vez por
+                conexión (desactivar detrás de RDS Proxy: PREPARE fija la sesión
+                y el proxy deja de multiplexar la conexión)
+            halfvec_index: Indexar y buscar sobre embedding::halfvec(1024)
+                (pgvector >= 0.7): índice HNSW de la mitad de tamaño y menos
+                memoria leída por búsqueda, con una pérdida de recall mínima.
+                Debe coincidir en ingesta y consulta
         """
         self.db_name = db_name
         self.region = region
         self.connection = None
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = None
+        self.iam_auth = iam_auth
+        self.prepared_statements = prepared_statements
+        self.halfvec_index = halfvec_index
+        # Sentencias ya preparadas en la conexión actual
+        self._prepared: set = set()
+        # hnsw.iterative_scan disponible (pgvector >= 0.8), se lee en _setup_database
+        self._iterative_scan = False
         
         # Obtener credenciales desde Secrets Manager
         if db_secret_arn:
@@ -44,32 +183,102 @@ class PostgresVectorClient:
     
     def _get_db_credentials(self, secret_arn: str) -> Dict[str, Any]:
         """Obtiene las credenciales de la base de datos desde Secrets Manager"""
-        secrets_client = boto3.client('secretsmanager', region_name=self.region)
+        import boto3
+        from botocore.config import Config
+        
+        secrets_client = boto3.client(
+            'secretsmanager',
+            region_name=self.region,
+            config=Config(
+                retries={"mode": "adaptive", "max_attempts": 5},
+                tcp_keepalive=True,
+                connect_timeout=3
+            )
+        )
         response = secrets_client.get_secret_value(SecretId=secret_arn)
         secret = json.loads(response['SecretString'])
         return secret
     
+    def _generate_auth_token(self) -> str:
+        """Genera un token IAM (válido 15 minutos) para conectarse vía RDS Proxy"""
+        import boto3
+        
+        rds_client = boto3.client('rds', region_name=self.region)
+        return rds_client.generate_db_auth_token(
+            DBHostname=self.host,
+            Port=self.port,
+            DBUsername=self.username,
+            Region=self.region
+        )
+    
     def _connect(self):
         """Establece conexión con PostgreSQL"""
+        # psycopg2 se importa al conectar: importar el módulo no carga el driver
+        import psycopg2
+        
         try:
-            self.connection = psycopg2.connect(
-                host=self.host,
-                port=self.port,
-                database=self.db_name,
-                user=self.username,
-                password=self.password
-            )
+            if self.iam_auth:
+                # El proxy exige TLS cuando se usa autenticación IAM
+                self.connection = psycopg2.connect(
+                    host=self.host,
+                    port=self.port,
+                    database=self.db_name,
+                    user=self.username,
+                    password=self._generate_auth_token(),
+                    sslmode='require'
+                )
+            else:
+                self.connection = psycopg2.connect(
+                    host=self.host,
+                    port=self.port,
+                    database=self.db_name,
+                    user=self.username,
+                    password=self.password
+                )
             self.connection.autocommit = False
+            self._prepared = set()
         except Exception as e:
             print(f"Error conectando a PostgreSQL: {str(e)}")
             raise
     
+    def ensure_connection(self):
+        """Reabre la conexión si se cerró (p.ej. entre invocaciones de Lambda)"""
+        if self.connection is None or self.connection.closed:
+            print("Conexión a PostgreSQL cerrada, reconectando...")
+            self._connect()
+    
+    def ping(self) -> bool:
+        """
+        Verifica la conexión con un SELECT 1 y reconecta si el servidor la cerró
+        
+        connection.closed solo detecta cierres del lado del cliente; una conexión
+        cerrada por timeout mientras el contenedor Lambda estaba congelado solo
+        falla al usarla.
+        
+        Returns:
+            True si la conexión existente seguía viva, False si hubo que reconectar
+        """
+        import psycopg2
+        
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            self.connection.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            print(f"Conexión a PostgreSQL perdida ({str(e).strip()}), reconectando...")
+            self._connect()
+            return False
+    
     def _setup_database(self):
         """Configura la base de datos con pgvector y crea las tablas necesarias"""
         try:
             with self.connection.cursor() as cursor:
                 # Crear extensión pgvector si no existe
                 cursor.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+                cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector';")
+                version = tuple(int(part) for part in cursor.fetchone()[0].split('.')[:2])
+                self._iterative_scan = version >= (0, 8)
                 
                 # Crear tabla para documentos con vectores
                 cursor.execute("""
@@ -85,10 +294,16 @@ class PostgresVectorClient:
                 """)
                 
                 # Crear índice para búsqueda vectorial (HNSW es más rápido que IVFFlat)
-                cursor.execute("""
-                    CREATE INDEX IF NOT EXISTS documents_embedding_idx 
-                    ON documents USING hnsw (embedding vector_cosine_ops);
-                """)
+                if self.halfvec_index:
+                    cursor.execute(f"""
+                        CREATE INDEX IF NOT EXISTS documents_embedding_halfvec_idx 
+                        ON documents USING hnsw (({_HALFVEC_COLUMN}) halfvec_cosine_ops);
+                    """)
+                else:
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS documents_embedding_idx 
+                        ON documents USING hnsw (embedding vector_cosine_ops);
+                    """)
                 
                 # Crear índice para búsqueda por document_id
                 cursor.execute("""
@@ -96,6 +311,44 @@ class PostgresVectorClient:
                     ON documents (document_id);
                 """)
                 
+                # Índice por hash de contenido de los chunks
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS documents_content_sha256_idx 
+                    ON documents ((metadata->>'content_sha256'));
+                """)
+                
+                # Índice por documento padre (borrar los chunks de una ingesta fallida)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS documents_parent_document_id_idx 
+                    ON documents ((metadata->>'parent_document_id'));
+                """)
+                
+                # Documentos ingestados por completo. Solo se registra el hash
+                # cuando todos sus chunks están indexados, así una ingesta a
+                # medias no se toma por duplicado en el reintento
+                cursor.execute("SELECT to_regclass('documents_ingested') IS NULL;")
+                create_ingested = cursor.fetchone()[0]
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS documents_ingested (
+                        content_sha256 CHAR(64) PRIMARY KEY,
+                        parent_document_id VARCHAR(255) NOT NULL,
+                        ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    );
+                """)
+                if create_ingested:
+                    # Una sola vez: registrar los documentos indexados antes de
+                    # que existiera la tabla
+                    cursor.execute("""
+                        INSERT INTO documents_ingested (content_sha256, parent_document_id)
+                        SELECT DISTINCT ON (metadata->>'content_sha256')
+                            metadata->>'content_sha256',
+                            metadata->>'parent_document_id'
+                        FROM documents
+                        WHERE metadata->>'content_sha256' IS NOT NULL
+                            AND metadata->>'parent_document_id' IS NOT NULL
+                        ON CONFLICT (content_sha256) DO NOTHING;
+                    """)
+                
                 self.connection.commit()
                 print("Base de datos configurada correctamente")
         except Exception as e:
@@ -107,7 +360,7 @@ class PostgresVectorClient:
         self,
         document_id: str,
         content: str,
-        embedding: List[float],
+        embedding: Sequence[float],
         metadata: Optional[Dict[str, Any]] = None
     ) -> bool:
         """
@@ -126,7 +379,7 @@ class PostgresVectorClient:
             with self.connection.cursor() as cursor:
                 cursor.execute("""
                     INSERT INTO documents (document_id, content, embedding, metadata)
-                    VALUES (%s, %s, %s, %s)
+                    VALUES (%s, %s, %s::vector, %s)
                     ON CONFLICT (document_id) 
                     DO UPDATE SET 
                         content = EXCLUDED.content,
@@ -136,7 +389,7 @@ class PostgresVectorClient:
                 """, (
                     document_id,
                     content,
-                    embedding,
+                    _vector_literal(embedding),
                     json.dumps(metadata) if metadata else None
                 ))
                 self.connection.commit()
@@ -153,50 +406,97 @@ class PostgresVectorClient:
         """
         Indexa múltiples documentos en batch
         
+        Las filas se cargan con COPY en una tabla temporal y se pasan a
+        documents con un único INSERT ... SELECT ... ON CONFLICT, en lugar de
+        un upsert por fila con el protocolo extendido. Detrás de RDS Proxy
+        (iam_auth) la tabla temporal fijaría la sesión al cliente durante toda
+        la conexión, igual que PREPARE: ahí se usa execute_values
+        
         Args:
             documents: Lista de documentos con keys: document_id, content, embedding, metadata
             
         Returns:
-            Número de documentos indexados exitosamente
+            Número de documentos indexados
+            
+        Raises:
+            Exception: Si falla la carga (tras hacer rollback del lote)
         """
+        if not documents:
+            return 0
+        
         try:
             with self.connection.cursor() as cursor:
-                values = [
-                    (
-                        doc['document_id'],
-                        doc['content'],
-                        doc['embedding'],
-                        json.dumps(doc.get('metadata'))
-                    )
-                    for doc in documents
-                ]
-                
-                execute_values(
-                    cursor,
-                    """
-                    INSERT INTO documents (document_id, content, embedding, metadata)
-                    VALUES %s
-                    ON CONFLICT (document_id) 
-                    DO UPDATE SET 
-                        content = EXCLUDED.content,
-                        embedding = EXCLUDED.embedding,
-                        metadata = EXCLUDED.metadata,
-                        updated_at = CURRENT_TIMESTAMP;
-                    """,
-                    values
-                )
+                if self.iam_auth:
+                    self._bulk_upsert_values(cursor, documents)
+                else:
+                    self._bulk_upsert_copy(cursor, documents)
                 self.connection.commit()
                 return len(documents)
         except Exception as e:
             self.connection.rollback()
             print(f"Error en bulk indexing: {str(e)}")
-            return 0
+            raise
+    
+    @staticmethod
+    def _bulk_upsert_copy(cursor, documents: List[Dict[str, Any]]):
+        """Carga los documentos con COPY en una tabla temporal y hace el upsert"""
+        buffer = io.StringIO()
+        for doc in documents:
+            buffer.write('\t'.join((
+                doc['document_id'].translate(_COPY_ESCAPES),
+                doc['content'].translate(_COPY_ESCAPES),
+                _vector_literal(doc['embedding']),
+                json.dumps(doc.get('metadata')).translate(_COPY_ESCAPES)
+            )))
+            buffer.write('\n')
+        buffer.seek(0)
+        
+        # Tabla temporal de la sesión; se vacía en cada commit
+        cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS documents_staging (
+                document_id VARCHAR(255) NOT NULL,
+                content TEXT NOT NULL,
+                embedding vector(1024),
+                metadata JSONB
+            ) ON COMMIT DELETE ROWS;
+        """)
+        cursor.copy_expert(
+            "COPY documents_staging (document_id, content, embedding, metadata) "
+            "FROM STDIN",
+            buffer
+        )
+        cursor.execute(_BULK_UPSERT_SQL.format(
+            source="SELECT document_id, content, embedding, metadata FROM documents_staging"
+        ))
+    
+    @staticmethod
+    def _bulk_upsert_values(cursor, documents: List[Dict[str, Any]]):
+        """Upsert con INSERT ... VALUES multi-fila (sin estado de sesión)"""
+        from psycopg2.extras import execute_values
+        
+        execute_values(
+            cursor,
+            _BULK_UPSERT_SQL.format(source="VALUES %s"),
+            [
+                (
+                    doc['document_id'],
+                    doc['content'],
+                    _vector_literal(doc['embedding']),
+                    json.dumps(doc.get('metadata'))
+                )
+                for doc in documents
+            ],
+            template="(%s, %s, %s::vector, %s)",
+            page_size=BULK_PAGE_SIZE
+        )
     
     def search_similar(
         self,
         query_embedding: List[float],
         top_k: int = 5,
-        min_similarity: float = 0.7
+        min_similarity: float = 0.7,
+        include_embeddings: bool = False,
+        filters: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
         """
         Busca documentos similares usando búsqueda vectorial
@@ -205,46 +505,240 @@ class PostgresVectorClient:
             query_embedding: Vector de embedding de la consulta
             top_k: Número de resultados a retornar
             min_similarity: Similitud mínima (0-1)
+            include_embeddings: Si incluir el vector de cada documento en
+                'embedding' (p.ej. para re-ranking MMR)
+            filters: Metadatos que deben contener los documentos (p.ej.
+                {"file_extension": ".pdf"})
             
         Returns:
             Lista de documentos con sus scores de similitud
         """
+        query_vector = _vector_literal(query_embedding)
+        filters_json = json.dumps(filters) if filters else None
         try:
             with self.connection.cursor() as cursor:
-                # Búsqueda por similitud coseno
-                # 1 - (embedding <=> query) da un score de 0 a 1
-                cursor.execute("""
-                    SELECT 
-                        document_id,
-                        content,
-                        metadata,
-                        1 - (embedding <=> %s::vector) as similarity
-                    FROM documents
-                    WHERE 1 - (embedding <=> %s::vector) >= %s
-                    ORDER BY embedding <=> %s::vector
-                    LIMIT %s;
-                """, (
-                    query_embedding,
-                    query_embedding,
-                    min_similarity,
-                    query_embedding,
-                    top_k
-                ))
+                self._set_search_params(cursor, top_k, filtered=bool(filters))
+                
+                if self.prepared_statements:
+                    statement = self._prepare_search(cursor, include_embeddings)
+                    cursor.execute(
+                        f"EXECUTE {statement} (%s, %s, %s);",
+                        (query_vector, filters_json, top_k)
+                    )
+                else:
+                    cursor.execute(_search_sql(include_embeddings, prepared=False, halfvec=self.halfvec_index), {
+                        'vector': query_vector,
+                        'filters': filters_json,
+                        'limit': top_k
+                    })
                 
                 results = []
                 for row in cursor.fetchall():
-                    results.append({
+                    similarity = float(row[3])
+                    if similarity < min_similarity:
+                        # Filas ordenadas por distancia: el resto tampoco pasa
+                        break
+                    result = {
                         'document_id': row[0],
                         'content': row[1],
                         'metadata': row[2],
-                        'similarity': float(row[3])
-                    })
-                
-                return results
+                        'similarity': similarity
+                    }
+                    if include_embeddings:
+                        # pgvector devuelve el texto '[x1,x2,...]', que es JSON válido
+                        result['embedding'] = json.loads(row[4])
+                    results.append(result)
+            
+            # Cerrar la transacción de solo lectura para poder reutilizar la
+            # conexión en la siguiente invocación
+            self.connection.rollback()
+            return results
         except Exception as e:
+            self.connection.rollback()
             print(f"Error en búsqueda: {str(e)}")
             return []
     
+    def _set_search_params(self, cursor, top_k: int, filtered: bool = False):
+        """
+        Ajusta ef_search (y el escaneo iterativo si hay filtros) solo para la
+        transacción actual (set_config con is_local equivale a SET LOCAL)
+        
+        Args:
+            cursor: Cursor de la transacción de búsqueda
+            top_k: Número de resultados pedidos
+            filtered: Si la búsqueda filtra por metadatos
+        """
+        ef_search = max(HNSW_EF_SEARCH_MIN, top_k * 4)
+        sql = "SELECT set_config('hnsw.ef_search', %s, true)"
+        if filtered:
+            ef_search = min(HNSW_EF_SEARCH_MAX, max(HNSW_EF_SEARCH_FILTERED, ef_search))
+            if self._iterative_scan:
+                # strict_order mantiene el orden por distancia del que depende
+                # el corte por min_similarity
+                sql += ", set_config('hnsw.iterative_scan', 'strict_order', true)"
+        cursor.execute(sql + ";", (str(ef_search),))
+    
+    def _prepare_search(self, cursor, include_embeddings: bool) -> str:
+        """
+        Prepara la búsqueda vectorial en la conexión actual (una vez por conexión)
+        
+        El servidor analiza y planifica la sentencia una sola vez; las
+        invocaciones siguientes solo envían EXECUTE con los parámetros.
+        
+        Returns:
+            Nombre de la sentencia preparada
+        """
+        statement = "rag_search_with_embeddings" if include_embeddings else "rag_search"
+        if statement not in self._prepared:
+            # PREPARE no es transaccional: la sentencia sobrevive al rollback
+            cursor.execute(
+                f"PREPARE {statement} (vector, jsonb, int) AS "
+                + _search_sql(include_embeddings, prepared=True, halfvec=self.halfvec_index)
+            )
+            self._prepared.add(statement)
+        return statement
+    
+    def search_similar_batch(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        min_similarity: float = 0.7
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Ejecuta varias búsquedas vectoriales en una sola consulta (UNION ALL)
+        
+        Cada rama mantiene su propio ORDER BY ... LIMIT, por lo que sigue
+        usando el índice HNSW; solo se ahorra una ida y vuelta por embedding.
+        
+        Args:
+            query_embeddings: Vectores de embedding de cada consulta
+            top_k: Número de resultados por consulta
+            min_similarity: Similitud mínima (0-1)
+            
+        Returns:
+            Una lista de resultados por embedding, en el mismo orden
+        """
+        if not query_embeddings:
+            return []
+        
+        # El vector de cada rama se envía una sola vez en la subconsulta q
+        distance_column, vector_type = _distance_operands(self.halfvec_index)
+        branch = f"""
+            (SELECT 
+                %s AS query_index,
+                document_id,
+                content,
+                metadata,
+                1 - ({distance_column} <=> q.v) as similarity
+            FROM documents, (SELECT %s::{vector_type} AS v) q
+            ORDER BY {distance_column} <=> q.v
+            LIMIT %s)
+        """
+        sql = " UNION ALL ".join([branch] * len(query_embeddings))
+        params = []
+        for i, query_embedding in enumerate(query_embeddings):
+            params.extend((i, _vector_literal(query_embedding), top_k))
+        
+        results: List[List[Dict[str, Any]]] = [[] for _ in query_embeddings]
+        try:
+            with self.connection.cursor() as cursor:
+                # Mismo ef_search que search_similar: sin él cada rama se queda
+                # en 40 candidatos aunque top_k sea mayor
+                self._set_search_params(cursor, top_k)
+                cursor.execute(sql, params)
+                for row in cursor.fetchall():
+                    similarity = float(row[4])
+                    if similarity < min_similarity:
+                        continue
+                    results[row[0]].append({
+                        'document_id': row[1],
+                        'content': row[2],
+                        'metadata': row[3],
+                        'similarity': similarity
+                    })
+            
+            self.connection.rollback()
+        except Exception as e:
+            self.connection.rollback()
+            print(f"Error en búsqueda batch: {str(e)}")
+            return [[] for _ in query_embeddings]
+        
+        # UNION ALL no garantiza el orden entre ramas; se reordena cada lista
+        for rows in results:
+            rows.sort(key=lambda r: r['similarity'], reverse=True)
+        return results
+    
+    def find_document_by_hash(self, content_sha256: str) -> Optional[str]:
+        """
+        Busca un documento ya ingestado por completo con el mismo contenido
+        
+        Args:
+            content_sha256: Hash SHA-256 del archivo original
+            
+        Returns:
+            ID del documento padre (parent_document_id) o None si no existe
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT parent_document_id
+                    FROM documents_ingested
+                    WHERE content_sha256 = %s;
+                """, (content_sha256,))
+                row = cursor.fetchone()
+            self.connection.rollback()  # Cerrar la transacción de solo lectura
+            return row[0] if row else None
+        except Exception as e:
+            self.connection.rollback()
+            print(f"Error buscando documento por hash: {str(e)}")
+            return None
+    
+    def mark_document_ingested(self, content_sha256: str, parent_document_id: str):
+        """
+        Registra que todos los chunks de un documento quedaron indexados
+        
+        Args:
+            content_sha256: Hash SHA-256 del archivo original
+            parent_document_id: ID del documento padre
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO documents_ingested (content_sha256, parent_document_id)
+                    VALUES (%s, %s)
+                    ON CONFLICT (content_sha256) DO UPDATE SET
+                        parent_document_id = EXCLUDED.parent_document_id,
+                        ingested_at = CURRENT_TIMESTAMP;
+                """, (content_sha256, parent_document_id))
+                self.connection.commit()
+        except Exception as e:
+            self.connection.rollback()
+            print(f"Error registrando documento ingestado: {str(e)}")
+            raise
+    
+    def delete_document_chunks(self, parent_document_id: str) -> int:
+        """
+        Elimina todos los chunks de un documento padre (p.ej. de una ingesta fallida)
+        
+        Args:
+            parent_document_id: ID del documento padre
+            
+        Returns:
+            Número de chunks eliminados
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    DELETE FROM documents
+                    WHERE metadata->>'parent_document_id' = %s;
+                """, (parent_document_id,))
+                self.connection.commit()
+                return cursor.rowcount
+        except Exception as e:
+            self.connection.rollback()
+            print(f"Error eliminando chunks del documento: {str(e)}")
+            raise
+    
     def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
         """
         Obtiene un documento por su ID
@@ -340,3 +834,24 @@ class PostgresVectorClient:
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit"""
         self.close()
+
+
+# Instancia global para reutilización en Lambda
+_postgres_client = None
+
+
+def get_postgres_client(**kwargs) -> PostgresVectorClient:
+    """
+    Obtiene una instancia singleton del cliente de PostgreSQL
+    Reutiliza la conexión (y la configuración de la base de datos, que solo
+    se ejecuta al crearla) entre invocaciones de un mismo contenedor Lambda
+    
+    Args:
+        **kwargs: Argumentos de PostgresVectorClient (solo se usan la primera vez)
+    """
+    global _postgres_client
+    if _postgres_client is None:
+        _postgres_client = PostgresVectorClient(**kwargs)
+    else:
+        _postgres_client.ensure_connection()
+    return _postgres_client